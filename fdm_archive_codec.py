@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+FDM Archive Codec
+Re-packs stored backup zips with zstd or xz for long-term retention, and back again
+"""
+import argparse
+import hashlib
+import json
+import lzma
+import os
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+from fdm_config_stream import (READ_CHUNK_SIZE, find_config_member, iter_config_objects,
+                               iter_zipped_config, open_config_stream)
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency, only needed for the zstd codec
+    zstandard = None
+
+# Repacked archives hold the bare config JSON, compressed as one stream
+CODEC_SUFFIXES = {'zstd': '.zst', 'xz': '.xz'}
+REPACKED_SUFFIXES = tuple(CODEC_SUFFIXES.values())
+DEFAULT_LEVELS = {'zstd': 12, 'xz': 6}
+
+# A long window lets repeated objects far apart in a large config match each other
+ZSTD_WINDOW_LOG = 27          # 128 MiB
+XZ_DICT_SIZE = 64 * 1024 * 1024
+# Trained dictionaries live in an archive's directory or its parent, named by
+# their dict_id, which zstd records in every frame compressed with them
+DICTIONARY_NAME = 'fdm_configs-{dict_id}.zdict'
+DICTIONARY_GLOB = 'fdm_configs-*.zdict'
+# Single dictionary used before names carried the id; its archives record no dict_id
+LEGACY_DICTIONARY_NAME = 'fdm_configs.zdict'
+ZSTD_FRAME_HEADER_MAX = 18
+DICTIONARY_SIZE = 112 * 1024
+MAX_DICTIONARY_SAMPLES = 100000
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise RuntimeError("The zstd codec requires the 'zstandard' package "
+                           "(pip3 install zstandard), or use --codec xz")
+
+
+def is_repacked(path):
+    """Check whether a path names a repacked (.zst/.xz) archive"""
+    return Path(path).suffix.lower() in REPACKED_SUFFIXES
+
+
+def find_dictionary(path, dict_id=None):
+    """Find a zstd dictionary next to an archive or one directory above
+
+    With a dict_id the dictionary of that id is returned (0 for the legacy
+    fdm_configs.zdict), otherwise the most recently trained one (None if
+    there is none).
+    """
+    path = Path(path).resolve()
+    for directory in (path.parent, path.parent.parent):
+        if dict_id is not None:
+            name = DICTIONARY_NAME.format(dict_id=dict_id) if dict_id else LEGACY_DICTIONARY_NAME
+            candidate = directory / name
+            if candidate.exists():
+                return candidate
+            continue
+        candidates = sorted(directory.glob(DICTIONARY_GLOB), key=lambda p: p.stat().st_mtime)
+        if candidates:
+            return candidates[-1]
+    return None
+
+
+def frame_dictionary_id(path):
+    """dict_id recorded in the header of a .zst archive (0 if it uses no dictionary)"""
+    _require_zstandard()
+    with open(path, 'rb') as f:
+        return zstandard.get_frame_parameters(f.read(ZSTD_FRAME_HEADER_MAX)).dict_id
+
+
+def dictionary_for(path):
+    """Path of the dictionary a .zst archive was compressed with (None if it needs none)"""
+    dict_id = frame_dictionary_id(path)
+    if not dict_id:
+        # Archives repacked before dict_ids were recorded may still need the legacy file
+        return find_dictionary(path, 0)
+    dictionary = find_dictionary(path, dict_id)
+    if dictionary is None:
+        raise RuntimeError(f"{Path(path).name} needs zstd dictionary "
+                           f"{DICTIONARY_NAME.format(dict_id=dict_id)}, which was not found")
+    return dictionary
+
+
+def _load_dictionary(dictionary):
+    if not dictionary:
+        return None
+    _require_zstandard()
+    return zstandard.ZstdCompressionDict(Path(dictionary).read_bytes())
+
+
+class _HashingReader:
+    """File-like wrapper hashing everything read through it"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        return data
+
+
+def codec_for(path):
+    """Codec name of a repacked archive, from its suffix"""
+    suffix = Path(path).suffix.lower()
+    for codec, codec_suffix in CODEC_SUFFIXES.items():
+        if suffix == codec_suffix:
+            return codec
+    raise ValueError(f"Not a repacked archive: {path}")
+
+
+@contextmanager
+def open_repacked(path, dictionary=None, codec=None):
+    """Open the decompressed config JSON of a .zst or .xz archive as a binary stream
+
+    For zstd the dictionary defaults to the one whose dict_id the archive's
+    frame header names (see dictionary_for).
+    """
+    path = Path(path)
+    codec = codec or codec_for(path)
+
+    if codec == 'xz':
+        with lzma.open(path, 'rb') as stream:
+            yield stream
+    else:
+        _require_zstandard()
+        dict_data = _load_dictionary(dictionary or dictionary_for(path))
+        decompressor = zstandard.ZstdDecompressor(dict_data=dict_data,
+                                                  max_window_size=2 ** ZSTD_WINDOW_LOG)
+        with open(path, 'rb') as raw, decompressor.stream_reader(raw) as stream:
+            yield stream
+
+
+def _compress(source, dest, codec, level, dictionary, threads):
+    """Compress the readable source into the writable dest"""
+    if codec == 'zstd':
+        _require_zstandard()
+        params = zstandard.ZstdCompressionParameters.from_level(
+            level, window_log=ZSTD_WINDOW_LOG, enable_ldm=True, threads=threads, write_checksum=True,
+            write_dict_id=True)
+        compressor = zstandard.ZstdCompressor(compression_params=params,
+                                              dict_data=_load_dictionary(dictionary))
+        compressor.copy_stream(source, dest, read_size=READ_CHUNK_SIZE * 16)
+    elif codec == 'xz':
+        compressor = lzma.LZMACompressor(format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC64, filters=[
+            {'id': lzma.FILTER_LZMA2, 'preset': level, 'dict_size': XZ_DICT_SIZE}])
+        for chunk in iter(lambda: source.read(READ_CHUNK_SIZE * 16), b''):
+            dest.write(compressor.compress(chunk))
+        dest.write(compressor.flush())
+    else:
+        raise ValueError(f"Unknown codec: {codec}")
+
+
+def repack_archive(zip_path, codec='zstd', level=None, dictionary=None, threads=0, keep=False):
+    """Re-pack an FDM export zip as <name>.zst or <name>.xz; returns a result dict
+
+    The repacked file is decompressed and compared (SHA-256) with the zip's
+    config before it is renamed into place, and only then is the zip
+    removed (unless keep). Zips with more than one member are left alone.
+    """
+    zip_path = Path(zip_path)
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    output_path = zip_path.with_suffix(CODEC_SUFFIXES[codec])
+    part_path = output_path.with_name(output_path.name + '.part')
+    if codec == 'zstd' and dictionary is None:
+        dictionary = find_dictionary(zip_path)
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        if len(zip_ref.namelist()) != 1:
+            raise ValueError(f"{zip_path.name} has {len(zip_ref.namelist())} members; "
+                             "only single-config exports can be repacked")
+        try:
+            with zip_ref.open(find_config_member(zip_ref)) as member, open(part_path, 'wb') as dest:
+                source = _HashingReader(member)
+                _compress(source, dest, codec, level, dictionary, threads)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+
+    try:
+        with open_repacked(part_path, dictionary, codec) as stream:
+            check = hashlib.sha256()
+            for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE * 16), b''):
+                check.update(chunk)
+        if check.digest() != source.sha256.digest():
+            raise ValueError(f"Round-trip check failed for {output_path.name}")
+    except Exception:
+        part_path.unlink()
+        raise
+
+    os.replace(part_path, output_path)
+    zip_size = zip_path.stat().st_size
+    if not keep:
+        zip_path.unlink()
+    return {'source': str(zip_path), 'output': str(output_path), 'codec': codec,
+            'configBytes': source.size, 'zipBytes': zip_size,
+            'repackedBytes': output_path.stat().st_size}
+
+
+def repack_archives(paths, codec='zstd', level=None, dictionary=None, workers=None, keep=False):
+    """Re-pack many archives in parallel processes; yields (path, result or exception)
+
+    zstd additionally compresses each archive on several threads, sharing
+    the CPUs between the worker processes. The standard library's lzma has
+    no threaded encoder, so xz throughput comes from the processes alone.
+    """
+    workers = workers or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // workers) if codec == 'zstd' else 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(repack_archive, path, codec, level, dictionary, threads, keep): path
+                   for path in paths}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+
+
+def train_dictionary(paths, output_dir, size=DICTIONARY_SIZE):
+    """Train a zstd dictionary on the objects of existing backups; returns its path
+
+    Samples are the JSON of individual config objects, which share most of
+    their keys and boilerplate across a fleet's exports. The dictionary is
+    written to output_dir as fdm_configs-<dict_id>.zdict; an existing file is
+    never replaced, since archives compressed with it can't be read without it.
+    """
+    _require_zstandard()
+    samples = []
+    for path in paths:
+        with open_config_stream(path) as stream:
+            for obj in iter_config_objects(stream):
+                samples.append(json.dumps(obj).encode('utf-8'))
+                if len(samples) >= MAX_DICTIONARY_SAMPLES:
+                    break
+        if len(samples) >= MAX_DICTIONARY_SAMPLES:
+            break
+    if not samples:
+        raise ValueError("No config objects found to train on")
+
+    dictionary = zstandard.train_dictionary(size, samples)
+    output_path = Path(output_dir) / DICTIONARY_NAME.format(dict_id=dictionary.dict_id())
+    with open(output_path, 'xb') as f:
+        f.write(dictionary.as_bytes())
+    return output_path
+
+
+def iter_upload_zip(path, chunk_size=READ_CHUNK_SIZE):
+    """Yield an FDM-importable zip rebuilt on the fly from a repacked archive"""
+    with open_repacked(path) as stream:
+        yield from iter_zipped_config(stream, chunk_size=chunk_size)
+
+
+def unpack_archive(path, output_path=None):
+    """Write a repacked archive back out as an FDM export zip; returns the zip path"""
+    path = Path(path)
+    output_path = Path(output_path) if output_path else path.with_suffix('.zip')
+    part_path = output_path.with_name(output_path.name + '.part')
+    with open(part_path, 'wb') as dest:
+        for chunk in iter_upload_zip(path):
+            dest.write(chunk)
+    os.replace(part_path, output_path)
+    return output_path
+
+
+def iter_archive_paths(paths, suffixes):
+    """Expand files and directories into the archives with the given suffixes"""
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from sorted(p for p in path.rglob('*') if p.suffix.lower() in suffixes)
+        else:
+            yield path
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Re-pack FDM backups for long-term retention")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    repack = commands.add_parser('repack', help="Re-pack .zip backups as .zst or .xz")
+    repack.add_argument('paths', nargs='+', help="Backup zips or directories of them")
+    repack.add_argument('--codec', choices=sorted(CODEC_SUFFIXES), default='zstd')
+    repack.add_argument('--level', type=int, help="Compression level (zstd 1-22, xz 0-9)")
+    repack.add_argument('--dict', help="zstd dictionary (default: the newest fdm_configs-<id>.zdict next "
+                        "to the archives; it must be found there under that name to read them back)")
+    repack.add_argument('--workers', type=int, help="Parallel processes [CPU count]")
+    repack.add_argument('--keep', action='store_true', help="Keep the original zips")
+
+    train = commands.add_parser('train', help="Train a zstd dictionary on existing backups")
+    train.add_argument('paths', nargs='+', help="Backups or directories of them")
+    train.add_argument('-o', '--output-dir', default='.',
+                       help="Directory for the new fdm_configs-<id>.zdict [current directory]")
+    train.add_argument('--size', type=int, default=DICTIONARY_SIZE, help="Dictionary size in bytes")
+
+    unpack = commands.add_parser('unpack', help="Turn a repacked backup back into an FDM zip")
+    unpack.add_argument('path', help="Repacked .zst or .xz backup")
+    unpack.add_argument('-o', '--output', help="Output .zip path [<name>.zip]")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+
+        if args.command == 'repack':
+            zip_paths = list(iter_archive_paths(args.paths, ('.zip',)))
+            print(f"🗜 Re-packing {len(zip_paths)} archive(s) with {args.codec}...")
+            before = after = failed = 0
+            for path, result in repack_archives(zip_paths, args.codec, args.level, args.dict,
+                                                args.workers, args.keep):
+                if isinstance(result, Exception):
+                    failed += 1
+                    print(f"✗ {path}: {result}")
+                    continue
+                before += result['zipBytes']
+                after += result['repackedBytes']
+                print(f"✓ {result['output']}: {result['zipBytes']:,} → {result['repackedBytes']:,} bytes")
+            if before:
+                print(f"\n📊 {before:,} → {after:,} bytes ({after / before:.1%}), {failed} failed")
+            if failed:
+                sys.exit(1)
+
+        elif args.command == 'train':
+            archives = list(iter_archive_paths(args.paths, ('.zip',) + REPACKED_SUFFIXES))
+            path = train_dictionary(archives, args.output_dir, args.size)
+            print(f"✓ Trained {path} ({path.stat().st_size:,} bytes) from {len(archives)} archive(s)")
+
+        else:
+            output = unpack_archive(args.path, args.output)
+            print(f"✓ Wrote {output}")
+
+    except FileExistsError as e:
+        print(f"\n✗ Dictionary already exists, not replacing it: {e.filename}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\n\n⚠ Operation cancelled by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+FDM Backup Crypto
+Chunked AES-256-GCM encryption of backups, applied while they stream to and from disk
+"""
+import argparse
+import base64
+import os
+import struct
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # Optional dependency, only needed for encrypted backups
+    AESGCM = None
+
+ENCRYPTED_SUFFIX = '.enc'
+CHUNK_SIZE = 1024 * 1024
+TAG_SIZE = 16
+# File header: magic, random nonce prefix, plaintext chunk size. It is
+# authenticated with every chunk, so it can't be swapped between files.
+MAGIC = b'FDMENC1\0'
+_HEADER = struct.Struct('>8s7sI')
+# Each chunk's nonce is the prefix, a chunk counter and a last-chunk flag, so
+# reordered, dropped or truncated chunks fail authentication
+_NONCE_SUFFIX = struct.Struct('>IB')
+
+# Environment variable holding a base64 key; otherwise the key file is used
+BACKUP_KEY_ENV = 'FDM_BACKUP_KEY'
+BACKUP_KEY_FILE_ENV = 'FDM_BACKUP_KEY_FILE'
+DEFAULT_KEY_FILE = Path.home() / '.fdm_config_manager' / 'backup.key'
+
+
+def _require_cryptography():
+    if AESGCM is None:
+        raise RuntimeError("Encrypted backups require the 'cryptography' package "
+                           "(pip3 install cryptography)")
+
+
+def is_encrypted(path):
+    """Check whether a path names an encrypted backup"""
+    return Path(path).suffix.lower() == ENCRYPTED_SUFFIX
+
+
+def plain_name(path):
+    """Path of a backup without its encryption suffix ('x.zip.enc' -> 'x.zip')"""
+    path = Path(path)
+    return path.with_suffix('') if is_encrypted(path) else path
+
+
+def default_key_file():
+    return Path(os.environ.get(BACKUP_KEY_FILE_ENV) or DEFAULT_KEY_FILE)
+
+
+def generate_key_file(key_file=None):
+    """Create a new random key file readable by the owner only; returns its path"""
+    _require_cryptography()
+    key_path = Path(key_file) if key_file else default_key_file()
+    key_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(base64.urlsafe_b64encode(AESGCM.generate_key(bit_length=256)) + b'\n')
+    return key_path
+
+
+def load_backup_key(key_file=None):
+    """The 32-byte backup key from key_file, FDM_BACKUP_KEY or the default key file"""
+    _require_cryptography()
+    encoded = None if key_file else os.environ.get(BACKUP_KEY_ENV)
+    if not encoded:
+        key_path = Path(key_file) if key_file else default_key_file()
+        if not key_path.exists():
+            raise RuntimeError(f"No backup key: set {BACKUP_KEY_ENV} or create {key_path} "
+                               "with 'fdm_backup_crypto.py keygen'")
+        encoded = key_path.read_text()
+
+    key = base64.urlsafe_b64decode(encoded.strip())
+    if len(key) != 32:
+        raise ValueError("Backup key must be 32 bytes (base64 encoded)")
+    return key
+
+
+class StreamEncryptor:
+    """Writable wrapper encrypting everything written through it into dest
+
+    Plaintext is sealed in CHUNK_SIZE pieces as it arrives; call finish()
+    once at the end to seal the final (possibly empty) chunk.
+    """
+
+    def __init__(self, dest, key, chunk_size=CHUNK_SIZE):
+        _require_cryptography()
+        self.dest = dest
+        self.chunk_size = chunk_size
+        self._aead = AESGCM(key)
+        self._prefix = os.urandom(7)
+        self._header = _HEADER.pack(MAGIC, self._prefix, chunk_size)
+        self._buf = bytearray()
+        self._counter = 0
+        dest.write(self._header)
+
+    def write(self, data):
+        self._buf += data
+        # A full chunk is held back until more data proves it isn't the last one
+        while len(self._buf) > self.chunk_size:
+            self._seal(self._buf[:self.chunk_size], last=False)
+            del self._buf[:self.chunk_size]
+        return len(data)
+
+    def finish(self):
+        self._seal(self._buf, last=True)
+        self._buf = bytearray()
+
+    def _seal(self, data, last):
+        nonce = self._prefix + _NONCE_SUFFIX.pack(self._counter, last)
+        self.dest.write(self._aead.encrypt(nonce, bytes(data), self._header))
+        self._counter += 1
+
+
+class DecryptingReader:
+    """Readable plaintext view of an encrypted backup stream
+
+    Raises ValueError if any chunk fails authentication, which covers a
+    wrong key, tampering, and truncation.
+    """
+
+    def __init__(self, source, key):
+        _require_cryptography()
+        self.source = source
+        header = source.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise ValueError("Not an encrypted backup (file too short)")
+        magic, self._prefix, self.chunk_size = _HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("Not an encrypted backup (bad header)")
+        self._header = header
+        self._aead = AESGCM(key)
+        self._plain = bytearray()
+        self._peeked = b''
+        self._counter = 0
+        self._done = False
+
+    def _read_sealed(self, size):
+        data = self._peeked
+        self._peeked = b''
+        while len(data) < size:
+            chunk = self.source.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def _open_next(self):
+        sealed = self._read_sealed(self.chunk_size + TAG_SIZE)
+        last = len(sealed) < self.chunk_size + TAG_SIZE
+        if not last:
+            self._peeked = self.source.read(1)
+            last = not self._peeked
+
+        nonce = self._prefix + _NONCE_SUFFIX.pack(self._counter, last)
+        try:
+            self._plain += self._aead.decrypt(nonce, sealed, self._header)
+        except InvalidTag:
+            raise ValueError("Encrypted backup failed authentication "
+                             "(wrong key, corrupted or truncated)") from None
+        self._counter += 1
+        self._done = last
+
+    def read(self, size=-1):
+        while not self._done and (size < 0 or len(self._plain) < size):
+            self._open_next()
+        if size < 0 or size > len(self._plain):
+            size = len(self._plain)
+        data = bytes(self._plain[:size])
+        del self._plain[:size]
+        return data
+
+
+@contextmanager
+def open_encrypted(path, key=None):
+    """Open an encrypted backup as a readable plaintext stream (key defaults to load_backup_key())"""
+    key = key or load_backup_key()
+    with open(path, 'rb') as raw:
+        yield DecryptingReader(raw, key)
+
+
+def encrypt_file(path, key=None, keep=False):
+    """Encrypt an existing backup to <name>.enc; returns the encrypted path"""
+    path = Path(path)
+    output_path = path.with_name(path.name + ENCRYPTED_SUFFIX)
+    part_path = output_path.with_name(output_path.name + '.part')
+    with open(path, 'rb') as source, open(part_path, 'wb') as dest:
+        encryptor = StreamEncryptor(dest, key or load_backup_key())
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            encryptor.write(chunk)
+        encryptor.finish()
+    os.replace(part_path, output_path)
+    if not keep:
+        path.unlink()
+    return output_path
+
+
+def decrypt_file(path, output_path=None, key=None):
+    """Write the plaintext of an encrypted backup; returns the output path"""
+    output_path = Path(output_path) if output_path else plain_name(path)
+    part_path = output_path.with_name(output_path.name + '.part')
+    with open_encrypted(path, key) as source, open(part_path, 'wb') as dest:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            dest.write(chunk)
+    os.replace(part_path, output_path)
+    return output_path
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Encrypt and decrypt FDM backups")
+    parser.add_argument('--key-file', help=f"Key file [${BACKUP_KEY_ENV}, ${BACKUP_KEY_FILE_ENV} "
+                        f"or {DEFAULT_KEY_FILE}]")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('keygen', help="Create a new backup key file")
+
+    encrypt = commands.add_parser('encrypt', help="Encrypt existing backups to <name>.enc")
+    encrypt.add_argument('paths', nargs='+', help="Backups to encrypt")
+    encrypt.add_argument('--keep', action='store_true', help="Keep the plaintext files")
+
+    decrypt = commands.add_parser('decrypt', help="Write the plaintext of an encrypted backup")
+    decrypt.add_argument('path', help="Encrypted .enc backup")
+    decrypt.add_argument('-o', '--output', help="Output path [<name> without .enc]")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+
+        if args.command == 'keygen':
+            key_path = generate_key_file(args.key_file)
+            print(f"🔑 Created {key_path}; keep a copy somewhere safe, backups can't be read without it")
+        elif args.command == 'encrypt':
+            key = load_backup_key(args.key_file)
+            for path in args.paths:
+                print(f"🔒 {encrypt_file(path, key, args.keep)}")
+        else:
+            output = decrypt_file(args.path, args.output, load_backup_key(args.key_file))
+            print(f"✓ Wrote {output}")
+
+    except FileExistsError as e:
+        print(f"\n✗ Key file already exists: {e.filename}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\n\n⚠ Operation cancelled by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
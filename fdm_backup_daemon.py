@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+FDM Backup Daemon
+Long-running scheduler that exports FDM configurations on cron-like rules
+"""
+import argparse
+import hashlib
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from fdm_backup_crypto import load_backup_key
+from fdm_fleet_exporter import FDMFleetExporter, load_inventory
+from fdm_metrics import METRICS
+from fdm_token_cache import FDMTokenCache
+
+# Retry a failed backup after this delay, doubled per attempt, until the next scheduled run
+RETRY_BASE_DELAY = 300
+RETRY_MAX_DELAY = 3600
+
+
+class CronSchedule:
+    """Five-field cron expression: minute hour day-of-month month day-of-week"""
+
+    _RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, self._RANGES))
+        # Like cron: if both day fields are restricted, either one matching is enough
+        self.day_or = fields[2] != '*' and fields[4] != '*'
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for part in field.split(','):
+            part, _, step = part.partition('/')
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(v) for v in part.split('-'))
+            else:
+                start = end = int(part)
+                if step:
+                    end = high
+            if start < low or end > high + (1 if high == 6 else 0):
+                raise ValueError(f"Cron value out of range: {field!r}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        # Sunday may be written as 7
+        return {0 if high == 6 and v == 7 else v for v in values}
+
+    def _day_matches(self, moment):
+        weekday = (moment.weekday() + 1) % 7  # cron counts from Sunday
+        in_days, in_weekdays = moment.day in self.days, weekday in self.weekdays
+        return (in_days or in_weekdays) if self.day_or else (in_days and in_weekdays)
+
+    def next_after(self, moment):
+        """First matching minute strictly after moment"""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+
+def stagger_offset(host, window):
+    """Stable per-device delay in [0, window) seconds, spreading starts over the window"""
+    if window <= 0:
+        return 0
+    return int(hashlib.sha256(host.encode()).hexdigest(), 16) % int(window)
+
+
+class FDMBackupDaemon:
+    """Schedules, dispatches and persists nightly exports for a fleet of devices
+
+    Authenticated sessions are kept per device between runs, start times are
+    spread over stagger_window seconds after each scheduled time, and the
+    queue of due jobs is saved to state_path so work resumes after a restart.
+    """
+
+    def __init__(self, devices, schedule, state_path, output_dir=".", max_workers=8,
+                 stagger_window=1800, export_timeout=300, token_cache=None, archive_format='zip',
+                 full_export_days=None, encryption_key=None):
+        self.devices = {device['host']: device for device in devices}
+        self.default_schedule = CronSchedule(schedule)
+        self.schedules = {host: CronSchedule(device['schedule']) if device.get('schedule')
+                          else self.default_schedule for host, device in self.devices.items()}
+        self.state_path = Path(state_path)
+        self.stagger_window = stagger_window
+        self.max_workers = max_workers
+        self.exporter = FDMFleetExporter(output_dir=output_dir, max_workers=max_workers,
+                                         export_timeout=export_timeout, token_cache=token_cache,
+                                         archive_format=archive_format,
+                                         full_export_days=full_export_days,
+                                         encryption_key=encryption_key)
+        self.sessions = {}
+        self.running = set()
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+
+    def _next_due(self, host, after=None):
+        """Next scheduled (and staggered) run time for a device, as a Unix timestamp"""
+        after = after or datetime.now()
+        # Look up the schedule from before the stagger so a run isn't skipped
+        base = after - timedelta(seconds=stagger_offset(host, self.stagger_window))
+        scheduled = self.schedules[host].next_after(base)
+        return scheduled.timestamp() + stagger_offset(host, self.stagger_window)
+
+    def load_state(self):
+        """Load the persisted job queue; devices without an entry get their next slot"""
+        state = {}
+        if self.state_path.exists():
+            with open(self.state_path, 'r') as f:
+                state = json.load(f).get('jobs', {})
+
+        for host in self.devices:
+            job = state.get(host) or {}
+            job.setdefault('due', self._next_due(host))
+            job.setdefault('attempts', 0)
+            self.jobs[host] = job
+
+    def save_state(self):
+        """Persist the job queue atomically"""
+        with self._lock:
+            data = {'savedAt': time.time(), 'jobs': self.jobs}
+            tmp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+
+    def stats(self):
+        """Queue depth (due jobs not yet started), running jobs and lag of the oldest due job"""
+        now = time.time()
+        with self._lock:
+            waiting = [job['due'] for host, job in self.jobs.items()
+                       if job['due'] <= now and host not in self.running]
+            return {
+                'queueDepth': len(waiting),
+                'running': len(self.running),
+                'lagSeconds': round(now - min(waiting), 1) if waiting else 0.0,
+                'nextDue': min((job['due'] for job in self.jobs.values()), default=None)
+            }
+
+    def _run_job(self, host):
+        """Export one device and reschedule it; the host is always released afterwards"""
+        try:
+            client = None
+            try:
+                client = self.sessions.get(host) or self.exporter.create_client(host)
+                result = self.exporter.export_device(self.devices[host], client=client)
+            except Exception as e:
+                # Treated like any failed export so the retry backoff applies
+                result = {'host': host, 'status': 'FAILED', 'stage': None, 'error': str(e)}
+                print(f"✗ [{host}] export crashed: {e}")
+
+            with self._lock:
+                job = self.jobs[host]
+                job['lastRun'] = time.time()
+                job['lastResult'] = result
+                if result['status'] == 'SUCCESS':
+                    self.sessions[host] = client
+                    job['attempts'] = 0
+                    job['due'] = self._next_due(host)
+                else:
+                    # Start from a fresh session next time in case this one went bad
+                    self.sessions.pop(host, None)
+                    job['attempts'] += 1
+                    retry_at = time.time() + min(RETRY_BASE_DELAY * 2 ** (job['attempts'] - 1),
+                                                 RETRY_MAX_DELAY)
+                    job['due'] = min(retry_at, self._next_due(host))
+
+            self.save_state()
+        except Exception as e:
+            print(f"✗ [{host}] failed to record the run: {e}")
+        finally:
+            with self._lock:
+                self.running.discard(host)
+            self._wakeup.set()
+
+    def stop(self, *_):
+        """Stop dispatching new jobs; running ones finish and state is saved"""
+        self._stopping = True
+        self._wakeup.set()
+
+    def run(self, status_path=None, status_interval=60):
+        """Dispatch due jobs until stopped"""
+        self.load_state()
+        self.save_state()
+        self.exporter.job_tracker.start()
+        print(f"🕒 Backup daemon started for {len(self.devices)} device(s), "
+              f"schedule '{self.default_schedule.expression}'")
+        last_status = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while not self._stopping:
+                now = time.time()
+                with self._lock:
+                    due = sorted((job['due'], host) for host, job in self.jobs.items()
+                                 if job['due'] <= now and host not in self.running)
+                    for _, host in due[:self.max_workers - len(self.running)]:
+                        self.running.add(host)
+                        pool.submit(self._run_job, host)
+                    waiting = [job['due'] for host, job in self.jobs.items()
+                               if host not in self.running]
+
+                if now - last_status >= status_interval:
+                    stats = self.stats()
+                    print(f"📊 Queue depth: {stats['queueDepth']}, running: {stats['running']}, "
+                          f"lag: {stats['lagSeconds']}s")
+                    if status_path:
+                        with open(status_path, 'w') as f:
+                            json.dump(stats, f)
+                    METRICS.log('daemon_status', **stats)
+                    METRICS.write_textfile()
+                    last_status = now
+
+                sleep_for = min([d - now for d in waiting] + [status_interval])
+                self._wakeup.wait(max(sleep_for, 1))
+                self._wakeup.clear()
+
+            print("\n⏹ Stopping: waiting for running exports to finish...")
+
+        self.exporter.job_tracker.stop()
+        self.save_state()
+
+
+def load_config(config_path):
+    """Load daemon settings from a JSON file"""
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    if 'inventory' not in config:
+        raise ValueError("Daemon config needs an 'inventory' file")
+    return config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run scheduled FDM configuration backups")
+    parser.add_argument('config', help="Daemon config (.json)")
+    args = parser.parse_args(argv)
+
+    try:
+        config = load_config(args.config)
+        METRICS.configure_from_env()
+        password = os.environ.get(config.get('passwordEnv', 'FDM_PASSWORD'))
+        devices = load_inventory(config['inventory'], default_password=password)
+        token_cache = FDMTokenCache(config['tokenCache']) if config.get('tokenCache') else None
+
+        daemon = FDMBackupDaemon(devices,
+                                 schedule=config.get('schedule', '0 2 * * *'),
+                                 state_path=config.get('stateFile', 'fdm_daemon_state.json'),
+                                 output_dir=config.get('outputDir', '.'),
+                                 max_workers=config.get('workers', 8),
+                                 stagger_window=config.get('staggerSeconds', 1800),
+                                 export_timeout=config.get('exportTimeout', 300),
+                                 token_cache=token_cache,
+                                 archive_format=config.get('archiveFormat', 'zip'),
+                                 full_export_days=(config.get('fullExportDays', 7)
+                                                   if config.get('skipUnchanged') else None),
+                                 encryption_key=(load_backup_key(config.get('backupKeyFile'))
+                                                 if config.get('encryptBackups') else None))
+
+        signal.signal(signal.SIGTERM, daemon.stop)
+        signal.signal(signal.SIGINT, daemon.stop)
+        daemon.run(status_path=config.get('statusFile'))
+
+    except Exception as e:
+        print(f"\n✗ Unexpected error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
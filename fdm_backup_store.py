@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+FDM Backup Store
+Content-addressed, deduplicated storage of exported FDM configurations
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+import zlib
+from pathlib import Path
+from fdm_config_stream import (canonical_json, iter_config_archive, iter_config_objects,
+                               open_config_stream, write_config_archive, ZIP_MEMBER_NAME)
+
+# Every Nth snapshot in a chain stores its full object list instead of a delta
+MAX_MANIFEST_CHAIN = 16
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    device TEXT NOT NULL,
+    snapshot TEXT NOT NULL,
+    created TEXT NOT NULL,
+    source TEXT,
+    object_count INTEGER NOT NULL,
+    new_objects INTEGER NOT NULL,
+    parent TEXT,
+    depth INTEGER NOT NULL,
+    manifest BLOB NOT NULL,
+    PRIMARY KEY (device, snapshot)
+);
+"""
+
+
+def encode_manifest(digests, parent_digests=None):
+    """Encode an ordered digest list, as copy runs from the parent list where possible
+
+    The result is a list whose items are either a literal digest or a
+    [start, length] run copied from parent_digests.
+    """
+    if not parent_digests:
+        return list(digests)
+
+    parent_index = {}
+    for index, digest in enumerate(parent_digests):
+        parent_index.setdefault(digest, index)
+
+    ops = []
+    for digest in digests:
+        start = parent_index.get(digest)
+        if start is None:
+            ops.append(digest)
+        elif ops and isinstance(ops[-1], list) and sum(ops[-1]) == start:
+            ops[-1][1] += 1
+        else:
+            ops.append([start, 1])
+    return ops
+
+
+def decode_manifest(ops, parent_digests=None):
+    """Expand an encoded manifest back into its ordered digest list"""
+    digests = []
+    for op in ops:
+        if isinstance(op, list):
+            digests.extend(parent_digests[op[0]:op[0] + op[1]])
+        else:
+            digests.append(op)
+    return digests
+
+
+class FDMBackupStore:
+    """Stores each config object once, keyed by the hash of its canonical form
+
+    Objects and snapshots live in one SQLite database under the store root.
+    Objects are zlib-compressed canonical JSON keyed by SHA-256. A snapshot is
+    a manifest of object hashes, stored as a delta against the device's
+    previous snapshot, so both storage and the cost of writing a new daily
+    backup follow what changed on the device rather than its total size.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.root / 'store.db'))
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        """Close the store database"""
+        self.db.close()
+
+    def list_snapshots(self, device=None):
+        """List snapshots as (device, snapshot_id) tuples, oldest first per device
+
+        Snapshots are ordered by when they were stored (rowid), not by id:
+        ids are free-form, and the created text has only second resolution
+        and a local UTC offset.
+        """
+        if device:
+            rows = self.db.execute('SELECT device, snapshot FROM snapshots WHERE device = ? '
+                                   'ORDER BY rowid', (device,))
+        else:
+            rows = self.db.execute('SELECT device, snapshot FROM snapshots ORDER BY device, rowid')
+        return rows.fetchall()
+
+    def load_manifest(self, device, snapshot_id):
+        """Load a snapshot's metadata and ordered list of object digests"""
+        row = self.db.execute('SELECT created, source, object_count, new_objects, parent, depth, '
+                              'manifest FROM snapshots WHERE device = ? AND snapshot = ?',
+                              (device, snapshot_id)).fetchone()
+        if not row:
+            raise ValueError(f"Snapshot not found: {device}/{snapshot_id}")
+
+        created, source, object_count, new_objects, parent, depth, manifest = row
+        ops = json.loads(zlib.decompress(manifest))
+        parent_digests = self.load_manifest(device, parent)['objects'] if parent else None
+
+        return {
+            'device': device,
+            'snapshot': snapshot_id,
+            'created': created,
+            'source': source,
+            'objectCount': object_count,
+            'newObjects': new_objects,
+            'depth': depth,
+            'objects': decode_manifest(ops, parent_digests)
+        }
+
+    def add_snapshot(self, device, archive_path, snapshot_id=None):
+        """Store an exported archive as a new snapshot and return its manifest
+
+        The snapshot id defaults to the archive's modification time.
+        """
+        archive_path = Path(archive_path)
+        snapshot_id = snapshot_id or time.strftime(
+            '%Y%m%dT%H%M%S', time.localtime(archive_path.stat().st_mtime))
+        if self.db.execute('SELECT 1 FROM snapshots WHERE device = ? AND snapshot = ?',
+                           (device, snapshot_id)).fetchone():
+            raise ValueError(f"Snapshot already exists: {device}/{snapshot_id}")
+
+        previous = self.list_snapshots(device)
+        parent = self.load_manifest(*previous[-1]) if previous else None
+        # Objects of the previous snapshot are known to be stored already
+        known = set(parent['objects']) if parent else set()
+
+        digests = []
+        new_objects = 0
+        with self.db:
+            with open_config_stream(archive_path) as stream:
+                for obj in iter_config_objects(stream):
+                    if not digests and (not isinstance(obj, dict) or obj.get('type') != 'metadata'):
+                        raise ValueError("First object must be metadata")
+                    data = canonical_json(obj)
+                    digest = hashlib.sha256(data).hexdigest()
+                    if digest not in known:
+                        cursor = self.db.execute('INSERT OR IGNORE INTO objects VALUES (?, ?)',
+                                                 (digest, zlib.compress(data)))
+                        new_objects += cursor.rowcount
+                        known.add(digest)
+                    digests.append(digest)
+
+            if not digests:
+                raise ValueError("Configuration must be a non-empty JSON array")
+
+            if parent and parent['depth'] + 1 < MAX_MANIFEST_CHAIN:
+                ops, parent_id, depth = (encode_manifest(digests, parent['objects']),
+                                         parent['snapshot'], parent['depth'] + 1)
+            else:
+                ops, parent_id, depth = digests, None, 0
+
+            created = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+            self.db.execute('INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (device, snapshot_id, created, archive_path.name, len(digests),
+                             new_objects, parent_id, depth,
+                             zlib.compress(json.dumps(ops, separators=(',', ':')).encode())))
+
+        return {
+            'device': device,
+            'snapshot': snapshot_id,
+            'created': created,
+            'source': archive_path.name,
+            'objectCount': len(digests),
+            'newObjects': new_objects,
+            'depth': depth,
+            'objects': digests
+        }
+
+    def iter_snapshot_objects(self, device, snapshot_id):
+        """Yield the canonical JSON bytes of each object in a snapshot, in order"""
+        for digest in self.load_manifest(device, snapshot_id)['objects']:
+            row = self.db.execute('SELECT data FROM objects WHERE digest = ?', (digest,)).fetchone()
+            if not row:
+                raise ValueError(f"Object {digest} missing from store")
+            yield zlib.decompress(row[0])
+
+    def iter_archive(self, device, snapshot_id):
+        """Yield an import zip for a snapshot chunk by chunk (e.g. for upload_config_stream)"""
+        return iter_config_archive(self.iter_snapshot_objects(device, snapshot_id), ZIP_MEMBER_NAME)
+
+    def build_archive(self, device, snapshot_id, output_path):
+        """Rebuild an import zip for a snapshot at output_path"""
+        write_config_archive(self.iter_snapshot_objects(device, snapshot_id), output_path)
+        return str(output_path)
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Deduplicated store for FDM config backups")
+    parser.add_argument('--store', default='fdm_backups', help="Store root directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help="Add exported archives as snapshots")
+    add.add_argument('archives', nargs='+', help="Archives written by fdm_config_retriever")
+    add.add_argument('--device', required=True, help="Device name or IP")
+    add.add_argument('--snapshot', help="Snapshot id (default: archive modification time)")
+
+    listing = commands.add_parser('list', help="List snapshots")
+    listing.add_argument('--device', help="Only list this device")
+
+    restore = commands.add_parser('restore', help="Rebuild an import zip from a snapshot")
+    restore.add_argument('device')
+    restore.add_argument('snapshot')
+    restore.add_argument('-o', '--output', help="Output .zip path [<device>-<snapshot>.zip]")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+        store = FDMBackupStore(args.store)
+
+        if args.command == 'add':
+            for archive in args.archives:
+                snapshot_id = args.snapshot if len(args.archives) == 1 else None
+                manifest = store.add_snapshot(args.device, archive, snapshot_id)
+                print(f"✓ Stored {archive} as {args.device}/{manifest['snapshot']}: "
+                      f"{manifest['objectCount']} objects, {manifest['newObjects']} new")
+        elif args.command == 'list':
+            snapshots = store.list_snapshots(args.device)
+            if not snapshots:
+                print("📁 No snapshots found")
+            for device, snapshot_id in snapshots:
+                print(f"  • {device}/{snapshot_id}")
+        elif args.command == 'restore':
+            output = args.output or f"{args.device}-{args.snapshot}.zip"
+            store.build_archive(args.device, args.snapshot, output)
+            print(f"✓ Rebuilt import archive: {output}")
+
+        store.close()
+
+    except KeyboardInterrupt:
+        print("\n\n⚠ Operation cancelled by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
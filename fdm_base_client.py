@@ -3,57 +3,397 @@
 FDM API Base Client
 Provides common functionality for FDM REST API interactions
 """
+import calendar
+import fnmatch
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-import requests.exceptions
 import urllib3
+from requests.adapters import HTTPAdapter
+from fdm_job_tracker import FDMJobTracker
+from fdm_metrics import METRICS, endpoint_label
+from fdm_request_policy import (IDEMPOTENT_METHODS, REJECTED_STATUSES, RETRYABLE_ERRORS, CircuitOpenError,
+                                RetryPolicy, host_controls)
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Refresh the access token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 60
+CONFIG_FILES_PAGE_SIZE = 100
+# Seconds a config file listing is reused before it is fetched again
+CONFIG_FILES_CACHE_TTL = 5.0
+FDM_TIME_FORMATS = ('%Y-%m-%d %H:%M:%SZ', '%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S.%fZ',
+                    '%Y-%m-%d %H:%M:%S')
+
+
+def parse_fdm_time(value):
+    """Parse an FDM timestamp (UTC) to a Unix time; None if missing or unrecognised"""
+    if isinstance(value, (int, float)):
+        # Epoch timestamps are given in milliseconds
+        return value / 1000 if value > 1e11 else float(value)
+    for time_format in FDM_TIME_FORMATS:
+        try:
+            return calendar.timegm(time.strptime(value, time_format))
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class SizedBody:
+    """Request body made of byte chunks with a known total length
+
+    The chunks are written to the socket one after another, never joined
+    into a copy, and sent with a Content-Length. The body can be sent
+    again, so requests carrying it are retried like plain bytes.
+    """
+    
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.length = sum(len(chunk) for chunk in self.chunks)
+    
+    def __len__(self):
+        return self.length
+    
+    def __iter__(self):
+        return iter(self.chunks)
+
 
 class FDMBaseClient:
     """Base class for FDM API clients following Single Responsibility Principle"""
     
-    def __init__(self, host):
-        self.base_url = f"https://{host}"
+    def __init__(self, host, job_tracker=None, token_cache=None, pool_connections=10,
+                 pool_maxsize=10, keep_alive=True, retry_policy=None):
+        self.host = host
+        # A full URL (e.g. http://127.0.0.1:8443 for the mock server) is used as-is
+        self.base_url = host.rstrip('/') if '://' in host else f"https://{host}"
         self.token = None
+        self.refresh_token = None
+        self.token_expires_at = None
+        self.refresh_expires_at = None
+        self.username = None
+        # Kept for one password login when a stored session can't be refreshed
+        self._password = None
+        self.token_cache = token_cache
+        self._auth_lock = threading.Lock()
+        
         self.session = requests.Session()
         self.session.verify = False
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+        
+        # Rate limiter and circuit breaker are shared by all clients of the same device
+        self.rate_limiter, self.circuit_breaker = host_controls(host)
+        self.retry_policy = retry_policy or RetryPolicy()
+        
+        # Pass a shared tracker to poll jobs of many clients from one loop
+        self.job_tracker = job_tracker or FDMJobTracker()
+        self._config_files_cache = None
     
+    @METRICS.phase('auth')
     def authenticate(self, username, password):
-        """Authenticate with FDM and get access token"""
+        """Authenticate with FDM and get access token
+        
+        With a token cache, a still-valid cached token is reused (or refreshed)
+        and the password grant is skipped entirely.
+        """
+        self.username = username
+        self._password = password
+        
+        if self.token_cache:
+            cached = self.token_cache.load(self.host, username)
+            if cached:
+                self._set_tokens(cached)
+                if not self._token_expiring():
+                    print("✓ Authentication successful (cached token)")
+                    return True
+                if self._refresh_access_token():
+                    print("✓ Authentication successful (refreshed token)")
+                    return True
+        
         try:
-            response = self.session.post(
-                f"{self.base_url}/api/fdm/latest/fdm/token",
-                json={"grant_type": "password", "username": username, "password": password},
-                timeout=30
-            )
-            response.raise_for_status()
-            self.token = response.json()['access_token']
+            self._request_token({"grant_type": "password", "username": username, "password": password})
             print("✓ Authentication successful")
             return True
         except Exception as e:
             print(f"✗ Authentication failed: {e}")
             return False
     
+    def _request_token(self, grant):
+        """POST a token grant and store the resulting tokens"""
+        response = self.session.post(
+            f"{self.base_url}/api/fdm/latest/fdm/token",
+            json=grant,
+            timeout=30
+        )
+        response.raise_for_status()
+        data = response.json()
+        
+        now = time.time()
+        tokens = {
+            'access_token': data['access_token'],
+            'refresh_token': data.get('refresh_token'),
+            'expires_at': now + data['expires_in'] if data.get('expires_in') else None,
+            'refresh_expires_at': (now + data['refresh_expires_in']
+                                   if data.get('refresh_expires_in') else None)
+        }
+        self._set_tokens(tokens)
+        if self.token_cache and self.username:
+            self.token_cache.save(self.host, self.username, tokens)
+    
+    def _set_tokens(self, tokens):
+        self.token = tokens.get('access_token')
+        self.refresh_token = tokens.get('refresh_token')
+        self.token_expires_at = tokens.get('expires_at')
+        self.refresh_expires_at = tokens.get('refresh_expires_at')
+    
+    def _token_expiring(self):
+        """Check whether the access token expires within TOKEN_REFRESH_MARGIN"""
+        return (self.token_expires_at is not None
+                and time.time() >= self.token_expires_at - TOKEN_REFRESH_MARGIN)
+    
+    def _refresh_expired(self):
+        """Check whether there is no refresh token or it has expired"""
+        return not self.refresh_token or bool(self.refresh_expires_at
+                                              and time.time() >= self.refresh_expires_at)
+    
+    def needs_login(self):
+        """Check whether a password login is required before the next request
+        
+        True without a token, or when the access token is (nearly) expired
+        and can no longer be refreshed, as happens to sessions kept between
+        scheduled runs.
+        """
+        return not self.token or (self._token_expiring() and self._refresh_expired())
+    
+    def _refresh_access_token(self):
+        """Exchange the refresh token for a new access token"""
+        if self._refresh_expired():
+            return False
+        try:
+            self._request_token({"grant_type": "refresh_token", "refresh_token": self.refresh_token})
+            return True
+        except Exception as e:
+            print(f"⚠ Token refresh failed: {e}")
+            if self.token_cache and self.username:
+                self.token_cache.clear(self.host, self.username)
+            return False
+    
+    def _renew_token(self):
+        """Refresh the access token, or log in once more with the stored password
+        
+        A cached refresh token may have been revoked or already used by
+        another process; the cache entry is dropped before the password
+        login replaces it.
+        """
+        if self._refresh_access_token():
+            return True
+        if self._password is None:
+            return False
+        if self.token_cache and self.username:
+            self.token_cache.clear(self.host, self.username)
+        try:
+            self._request_token({"grant_type": "password", "username": self.username,
+                                 "password": self._password})
+            print("✓ Re-authenticated after a failed token refresh")
+            return True
+        except Exception as e:
+            print(f"⚠ Re-authentication failed: {e}")
+            return False
+    
     def _get_headers(self):
         """Get authorization headers (DRY principle)"""
         return {"Authorization": f"Bearer {self.token}"}
     
-    def _make_request(self, method, endpoint, **kwargs):
-        """Generic request handler (DRY principle)"""
-        kwargs.setdefault('headers', self._get_headers())
+    @staticmethod
+    def _is_replayable(kwargs):
+        """Check whether a request body can be sent a second time"""
+        return kwargs.get('files') is None and isinstance(kwargs.get('data'),
+                                                          (type(None), bytes, str, dict, SizedBody))
+    
+    def _make_request(self, method, endpoint, idempotent=None, **kwargs):
+        """Generic request handler (DRY principle)
+        
+        Requests are rate limited per device and refused fast while the
+        device's circuit breaker is open. Connection errors and 429/5xx
+        answers are retried with jittered exponential backoff when that is
+        safe: always for idempotent methods (or idempotent=True), for other
+        methods only if the device never acted on the request. The access
+        token is refreshed shortly before it expires, and once more
+        (retrying the request) if FDM answers 401; when refreshing fails the
+        client logs in again with its password. With metrics enabled every
+        call is timed as a request span.
+        """
+        if not METRICS.enabled:
+            return self._send_request(method, endpoint, idempotent, **kwargs)
+        
+        with METRICS.span('request', host=self.host, method=method.upper(),
+                          endpoint=endpoint_label(endpoint)) as span:
+            response = self._send_request(method, endpoint, idempotent, **kwargs)
+            span.set(status=response.status_code)
+            return response
+    
+    def _send_request(self, method, endpoint, idempotent=None, **kwargs):
+        """Send a request under the retry, rate limit and circuit breaker policy"""
+        if self.token and self._token_expiring():
+            with self._auth_lock:
+                if self._token_expiring():
+                    self._renew_token()
+        
+        # Extra headers from the caller are sent along with the current auth header
+        kwargs['headers'] = {**self._get_headers(), **kwargs.get('headers', {})}
         kwargs.setdefault('timeout', 30)
         
         url = f"{self.base_url}/api/fdm/latest/{endpoint}"
-        response = self.session.request(method, url, **kwargs)
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        replayable = self._is_replayable(kwargs)
+        policy = self.retry_policy
+        attempt = 0
+        
+        while True:
+            try:
+                response = self._send_once(method, url, kwargs)
+            except CircuitOpenError:
+                raise
+            except RETRYABLE_ERRORS as e:
+                if (replayable and attempt < policy.max_retries
+                        and (idempotent or policy.never_sent(e))):
+                    time.sleep(policy.delay(attempt))
+                    attempt += 1
+                    continue
+                raise
+            
+            status = response.status_code
+            if (status in policy.retry_statuses and replayable and attempt < policy.max_retries
+                    and (idempotent or status in REJECTED_STATUSES)):
+                delay = policy.delay(attempt, response.headers.get('Retry-After'))
+                response.close()
+                time.sleep(delay)
+                attempt += 1
+                continue
+            break
+        
+        if attempt:
+            METRICS.annotate(retries=attempt)
+        
+        if response.status_code == 401 and (self.refresh_token or self._password) and replayable:
+            sent_token = self.token
+            with self._auth_lock:
+                # Another thread may have refreshed while we waited for the lock
+                refreshed = self.token != sent_token or self._renew_token()
+            if refreshed:
+                response.close()
+                kwargs['headers'] = {**kwargs['headers'], **self._get_headers()}
+                response = self._send_once(method, url, kwargs)
+        
         response.raise_for_status()
         return response
     
-    def list_config_files(self):
+    def _send_once(self, method, url, kwargs):
+        """Send a single attempt through the device's circuit breaker and rate limiter
+        
+        Every attempt that gets past the breaker records an outcome, whatever
+        it raises, so a half-open circuit's trial request can't leave the
+        device blocked.
+        """
+        self.circuit_breaker.before_request(self.host)
+        try:
+            self.rate_limiter.acquire()
+            response = self.session.request(method, url, **kwargs)
+        except BaseException:
+            self.circuit_breaker.record_failure()
+            raise
+        
+        if response.status_code in self.retry_policy.retry_statuses:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+        return response
+    
+    def check_job_status(self, endpoint, job_id, label='job'):
+        """Get status of a job from a jobs/* endpoint (None if unavailable)"""
+        try:
+            response = self._make_request('GET', f'{endpoint}/{job_id}')
+            return response.json()
+        except Exception as e:
+            # Job status endpoint may return 404 if job is complete or not found
+            if hasattr(e, 'response') and hasattr(e.response, 'status_code') and e.response.status_code == 404:
+                return None
+            print(f"✗ Failed to check {label} status: {e}")
+            return None
+    
+    def track_job(self, endpoint, job_id, timeout=300, label='job', **kwargs):
+        """Watch a job with the client's job tracker and return a Future for its final status"""
+        return self.job_tracker.watch(lambda: self.check_job_status(endpoint, job_id, label),
+                                      timeout=timeout, label=label, **kwargs)
+    
+    def get_pending_changes(self, timeout=30):
+        """Number of changes waiting to be deployed on the device"""
+        response = self._make_request('GET', 'operational/pendingchanges', params={'limit': 1},
+                                      timeout=timeout)
+        data = response.json()
+        return data.get('paging', {}).get('count', len(data.get('items', [])))
+    
+    def iter_config_files(self, pattern=None, older_than=None, page_size=CONFIG_FILES_PAGE_SIZE,
+                          max_age=CONFIG_FILES_CACHE_TTL):
+        """Lazily yield config file entries from action/configfiles
+        
+        Pages are fetched with offset/limit only as the iterator is consumed.
+        A complete listing is cached for max_age seconds (0 disables the
+        cache), and the cache is dropped whenever this client deletes a file.
+        pattern is a shell-style match on diskFileName, and older_than
+        (seconds) keeps only files last modified before that age.
+        """
+        cutoff = time.time() - older_than if older_than is not None else None
+        for file_info in self._iter_config_file_pages(page_size, max_age):
+            if pattern and not fnmatch.fnmatch(file_info.get('diskFileName', ''), pattern):
+                continue
+            if cutoff is not None:
+                modified = parse_fdm_time(file_info.get('dateModified'))
+                if modified is None or modified >= cutoff:
+                    continue
+            yield file_info
+    
+    def _iter_config_file_pages(self, page_size, max_age):
+        cached = self._config_files_cache
+        if cached and max_age and time.monotonic() - cached[0] < max_age:
+            yield from cached[1]
+            return
+        
+        fetched_at = time.monotonic()
+        items = []
+        offset = 0
+        while True:
+            response = self._make_request('GET', 'action/configfiles',
+                                          params={'offset': offset, 'limit': page_size})
+            data = response.json()
+            page = data.get('items', [])
+            items.extend(page)
+            yield from page
+            
+            offset += len(page)
+            total = data.get('paging', {}).get('count')
+            if len(page) < page_size or not page or (total is not None and offset >= total):
+                break
+        # Only a listing that was read to the end is worth caching
+        self._config_files_cache = (fetched_at, items)
+    
+    def invalidate_config_files(self):
+        """Forget the cached config file listing"""
+        self._config_files_cache = None
+    
+    def config_file_index(self, max_age=CONFIG_FILES_CACHE_TTL):
+        """Map diskFileName -> file entry for every config file on the device"""
+        return {f['diskFileName']: f for f in self.iter_config_files(max_age=max_age)}
+    
+    def list_config_files(self, pattern=None):
         """List available configuration files on FDM"""
         try:
-            response = self._make_request('GET', 'action/configfiles')
-            files = response.json().get('items', [])
+            files = list(self.iter_config_files(pattern=pattern, max_age=0))
             
             if files:
                 print(f"\n📁 Available configuration files ({len(files)}):")
@@ -75,8 +415,36 @@ class FDMBaseClient:
         """Delete a configuration file from FDM"""
         try:
             self._make_request('DELETE', f'action/configfiles/{filename}')
+            self.invalidate_config_files()
             print(f"✓ Deleted file: {filename}")
             return True
         except Exception as e:
             print(f"✗ Failed to delete {filename}: {e}")
             return False
+    
+    def prune_config_files(self, older_than=None, keep_latest=0, pattern=None, max_workers=4,
+                           dry_run=False):
+        """Delete old config files from the device concurrently; returns the deleted names
+        
+        Files matching pattern and older than older_than seconds are removed,
+        except the keep_latest most recent ones. Deletes go through the
+        device's rate limiter, so max_workers only bounds the parallelism.
+        """
+        files = sorted(self.iter_config_files(pattern=pattern, max_age=0),
+                       key=lambda f: parse_fdm_time(f.get('dateModified')) or 0, reverse=True)
+        cutoff = time.time() - older_than if older_than is not None else None
+        stale = [f['diskFileName'] for f in files[keep_latest:]
+                 if cutoff is None or (parse_fdm_time(f.get('dateModified')) or cutoff) < cutoff]
+        
+        if not stale:
+            print("📁 No configuration files to prune")
+            return []
+        if dry_run:
+            for name in stale:
+                print(f"  • Would delete: {name}")
+            return stale
+        
+        print(f"🧹 Pruning {len(stale)} configuration file(s)...")
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            deleted = [name for name, ok in zip(stale, pool.map(self.delete_config_file, stale)) if ok]
+        return deleted
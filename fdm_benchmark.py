@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+FDM Benchmark
+End-to-end timings of the export and import clients against the local mock server
+"""
+import argparse
+import contextlib
+import io
+import json
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from fdm_config_importer import FDMConfigImporter
+from fdm_config_retriever import FDMConfigRetriever
+
+DEFAULT_SIZES = (1000, 10000, 100000, 500000)
+PHASES = ('auth', 'export', 'download', 'validate', 'upload', 'import')
+
+
+def repo_version():
+    """Version label for benchmark history (git describe, or 'unknown')"""
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty', '--tags'],
+                                cwd=Path(__file__).resolve().parent,
+                                capture_output=True, text=True, timeout=10)
+        return result.stdout.strip() or 'unknown'
+    except (OSError, subprocess.SubprocessError):
+        return 'unknown'
+
+
+@contextlib.contextmanager
+def mock_server(objects, job_latency, extra_args=()):
+    """Run fdm_mock_server.py in a subprocess so it doesn't skew client memory figures"""
+    command = [sys.executable, '-u', str(Path(__file__).resolve().parent / 'fdm_mock_server.py'),
+               '--port', '0', '--objects', str(objects), '--job-latency', str(job_latency),
+               *extra_args]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    try:
+        match = re.search(r'(https?://\S+)', process.stdout.readline())
+        if not match:
+            raise RuntimeError("Mock server failed to start")
+        yield match.group(1)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+class PhaseTimer:
+    """Collects wall time and peak traced memory per benchmark phase"""
+
+    def __init__(self):
+        self.results = {}
+
+    @contextlib.contextmanager
+    def phase(self, name, quiet=True):
+        if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+; on 3.8 peaks are cumulative
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        # Client progress output would dominate the small runs, so swallow it
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            yield
+        self.results[name] = {
+            'seconds': round(time.perf_counter() - start, 4),
+            'peakMemoryBytes': tracemalloc.get_traced_memory()[1]
+        }
+
+
+def run_benchmark(url, work_dir, objects):
+    """Run one auth/export/download/validate/upload/import cycle; returns the results dict"""
+    timer = PhaseTimer()
+    retriever = FDMConfigRetriever(url)
+    importer = FDMConfigImporter(url, job_tracker=retriever.job_tracker)
+
+    tracemalloc.start()
+    try:
+        with timer.phase('auth'):
+            if not retriever.authenticate('admin', 'benchmark'):
+                raise RuntimeError("Authentication against mock server failed")
+        with contextlib.redirect_stdout(io.StringIO()):
+            importer.authenticate('admin', 'benchmark')
+
+        with timer.phase('export'):
+            job_id = retriever.export_configuration()
+            status = retriever.wait_for_export_completion(job_id, timeout=600)
+        if not status:
+            raise RuntimeError("Export failed")
+
+        with timer.phase('download'):
+            path = retriever.download_config_file(status['diskFileName'], work_dir)
+        if not path:
+            raise RuntimeError("Download failed")
+        size = Path(path).stat().st_size
+        timer.results['download'].update(
+            bytes=size, mbPerSecond=round(size / 1e6 / max(timer.results['download']['seconds'], 1e-9), 2))
+
+        with timer.phase('validate'):
+            if not importer.validate_config_file(path):
+                raise RuntimeError("Validation failed")
+
+        with timer.phase('upload'):
+            disk_filename = importer.upload_config_file(path)
+        if not disk_filename:
+            raise RuntimeError("Upload failed")
+
+        with timer.phase('import'):
+            job_id = importer.import_configuration(disk_filename)
+            if not importer.wait_for_import_completion(job_id):
+                raise RuntimeError("Import failed")
+    finally:
+        tracemalloc.stop()
+        retriever.job_tracker.stop()
+
+    return {'objects': objects, 'phases': timer.results}
+
+
+def load_history(history_path):
+    """Read previous benchmark runs (one JSON object per line)"""
+    try:
+        with open(history_path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def compare(previous, current):
+    """Percentage change in seconds per phase versus the previous run of the same size"""
+    changes = {}
+    for name, phase in current['phases'].items():
+        before = previous.get('phases', {}).get(name, {}).get('seconds')
+        if before:
+            changes[name] = round((phase['seconds'] - before) / before * 100, 1)
+    return changes
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Benchmark the FDM clients against the mock server")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="Synthetic config sizes in objects")
+    parser.add_argument('--job-latency', type=float, default=0.5, help="Mock job duration in seconds")
+    parser.add_argument('--history', default='fdm_benchmark_history.jsonl',
+                        help="File that results are appended to and compared against")
+    parser.add_argument('--server-arg', action='append', default=[],
+                        help="Extra argument passed through to fdm_mock_server.py (repeatable)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+        version = repo_version()
+        history = load_history(args.history)
+        print(f"🏁 Benchmarking {version} for sizes: {', '.join(f'{n:,}' for n in args.sizes)}")
+
+        for objects in args.sizes:
+            with mock_server(objects, args.job_latency, args.server_arg) as url, \
+                    tempfile.TemporaryDirectory() as work_dir:
+                result = run_benchmark(url, work_dir, objects)
+            result.update(version=version, timestamp=time.time())
+
+            print(f"\n📊 {objects:,} objects ({result['phases']['download']['bytes']:,} byte archive)")
+            previous = next((run for run in reversed(history) if run.get('objects') == objects), None)
+            changes = compare(previous, result) if previous else {}
+            for name in PHASES:
+                phase = result['phases'][name]
+                line = (f"   • {name:<9}{phase['seconds']:>9.3f}s  "
+                        f"peak {phase['peakMemoryBytes'] / 1e6:>8.1f} MB")
+                if name in changes:
+                    line += f"  ({changes[name]:+.1f}% vs {previous.get('version')})"
+                print(line)
+
+            with open(args.history, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+            history.append(result)
+
+        print(f"\n✓ Results appended to {args.history}")
+
+    except KeyboardInterrupt:
+        print("\n\n⚠ Operation cancelled by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+FDM Bulk Verify
+Checks that every stored backup is restorable, in parallel, skipping unchanged archives
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from fdm_config_index import iter_archives
+from fdm_config_stream import summarize_config
+
+# Metadata fields an FDM export must carry to be importable
+REQUIRED_METADATA = ('softwareVersion', 'hardwareModel')
+HASH_CHUNK_SIZE = 1024 * 1024
+POOL_CHUNKSIZE = 16
+COMMIT_EVERY = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    digest TEXT PRIMARY KEY,
+    ok INTEGER NOT NULL,
+    error TEXT,
+    object_count INTEGER,
+    software_version TEXT,
+    hardware_model TEXT,
+    verified_at REAL NOT NULL
+);
+"""
+
+
+def hash_archive(path):
+    """SHA-256 of an archive's bytes; returns (path, digest)"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return path, sha256.hexdigest()
+
+
+def _hash_or_error(path):
+    """hash_archive() that reports a file which vanished or can't be read; returns (path, digest, error)"""
+    try:
+        return (*hash_archive(path), None)
+    except OSError as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+def _error_result(path, error):
+    return {'path': path, 'ok': False, 'error': error, 'objectCount': None,
+            'softwareVersion': None, 'hardwareModel': None, 'cached': False}
+
+
+def verify_archive(path):
+    """Fully check one archive; returns a result dict with ok and error
+
+    The whole config is decompressed (checking the zip CRC or zstd/xz
+    checksum) and parsed object by object; the first object must be
+    metadata with the fields in REQUIRED_METADATA, and every entry after it
+    must be a typed object.
+    """
+    result = {'path': path, 'ok': False, 'error': None, 'objectCount': None,
+              'softwareVersion': None, 'hardwareModel': None}
+    try:
+        if path.lower().endswith('.zip'):
+            with zipfile.ZipFile(path, 'r') as zip_ref:
+                # The config member is CRC-checked while it is parsed below
+                bad_member = zip_ref.testzip() if len(zip_ref.namelist()) > 1 else None
+            if bad_member:
+                raise ValueError(f"CRC check failed for zip member {bad_member}")
+
+        summary = summarize_config(path)
+        metadata = summary['metadata']
+        result.update(objectCount=summary['objectCount'],
+                      softwareVersion=metadata.get('softwareVersion'),
+                      hardwareModel=metadata.get('hardwareModel'))
+
+        missing = [field for field in REQUIRED_METADATA if not metadata.get(field)]
+        if missing:
+            raise ValueError(f"Metadata missing {', '.join(missing)}")
+        if summary['objectCount'] < 2:
+            raise ValueError("No configuration objects after metadata")
+        malformed = summary['types'].get('invalid', 0) + summary['types'].get('unknown', 0)
+        if malformed:
+            raise ValueError(f"{malformed} entries are not typed config objects")
+
+        result['ok'] = True
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+
+class VerifyCache:
+    """SQLite record of verified archives: file stat -> digest -> result
+
+    A file whose size and mtime are unchanged is not read again. A file
+    that was touched or copied but hashes the same reuses its result. Only
+    passing results are kept: a failure may come from the environment (a
+    missing codec, dictionary or key) rather than the archive, so failed
+    archives are checked again on every run.
+    """
+
+    def __init__(self, db_path):
+        self.db = sqlite3.connect(str(db_path))
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def lookup_stat(self, path, stat):
+        """Cached result for an unchanged file (None if it changed or is new)"""
+        row = self.db.execute(
+            'SELECT r.ok, r.error, r.object_count, r.software_version, r.hardware_model '
+            'FROM files f JOIN results r ON r.digest = f.digest '
+            'WHERE f.path = ? AND f.size = ? AND f.mtime_ns = ? AND r.ok',
+            (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        return self._to_result(path, row) if row else None
+
+    def lookup_digest(self, path, digest):
+        """Cached result for archive content seen before under any path"""
+        row = self.db.execute(
+            'SELECT ok, error, object_count, software_version, hardware_model '
+            'FROM results WHERE digest = ? AND ok', (digest,)).fetchone()
+        return self._to_result(path, row) if row else None
+
+    @staticmethod
+    def _to_result(path, row):
+        ok, error, count, version, model = row
+        return {'path': path, 'ok': bool(ok), 'error': error, 'objectCount': count,
+                'softwareVersion': version, 'hardwareModel': model, 'cached': True}
+
+    def record_file(self, path, stat, digest):
+        self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                        (path, stat.st_size, stat.st_mtime_ns, digest))
+
+    def record_result(self, digest, result):
+        if not result['ok']:
+            return
+        self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (digest, int(result['ok']), result['error'], result['objectCount'],
+                         result['softwareVersion'], result['hardwareModel'], time.time()))
+
+    def commit(self):
+        self.db.commit()
+
+
+def bulk_verify(paths, cache, workers=None, force=False):
+    """Verify archives under paths; yields one result dict per archive
+
+    Unchanged archives come straight from the cache. The rest are hashed,
+    then those with unseen content are verified, both across a process pool.
+    A file that disappears or can't be read during the run is reported as
+    failed without stopping the others.
+    """
+    stale = []
+    for archive in iter_archives(paths):
+        archive = str(Path(archive).resolve())
+        try:
+            stat = os.stat(archive)
+        except OSError as e:
+            yield _error_result(archive, f"{type(e).__name__}: {e}")
+            continue
+        cached = None if force else cache.lookup_stat(archive, stat)
+        if cached:
+            yield cached
+        else:
+            stale.append((archive, stat))
+    if not stale:
+        return
+
+    stats = dict(stale)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        for archive, digest, error in pool.map(_hash_or_error, list(stats), chunksize=POOL_CHUNKSIZE):
+            if error:
+                yield _error_result(archive, error)
+                continue
+            cache.record_file(archive, stats[archive], digest)
+            cached = None if force else cache.lookup_digest(archive, digest)
+            if cached:
+                yield cached
+            else:
+                pending[archive] = digest
+
+        for done, result in enumerate(pool.map(verify_archive, list(pending),
+                                               chunksize=POOL_CHUNKSIZE), 1):
+            cache.record_result(pending[result['path']], result)
+            if done % COMMIT_EVERY == 0:
+                cache.commit()
+            result['cached'] = False
+            yield result
+    cache.commit()
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Verify that stored FDM backups are restorable")
+    parser.add_argument('paths', nargs='+', help="Backup archives or directories of them")
+    parser.add_argument('-w', '--workers', type=int, help="Parallel processes [CPU count]")
+    parser.add_argument('--cache', default='fdm_verify_cache.db', help="Result cache database")
+    parser.add_argument('--force', action='store_true', help="Re-verify everything, ignoring the cache")
+    parser.add_argument('--report', help="Write every result to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+        cache = VerifyCache(args.cache)
+        started = time.time()
+        results = []
+
+        print("🔍 Verifying backups...")
+        for result in bulk_verify(args.paths, cache, args.workers, args.force):
+            results.append(result)
+            if not result['ok']:
+                print(f"✗ {result['path']}: {result['error']}")
+        cache.close()
+
+        failed = sum(1 for result in results if not result['ok'])
+        cached = sum(1 for result in results if result['cached'])
+        print(f"\n📊 {len(results)} archive(s): {len(results) - failed} OK, {failed} failed "
+              f"({cached} from cache) in {time.time() - started:.1f}s")
+
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump({'verifiedAt': time.time(), 'results': results}, f, indent=2)
+            print(f"✓ Report written to {args.report}")
+
+        if failed:
+            sys.exit(1)
+
+    except KeyboardInterrupt:
+        print("\n\n⚠ Operation cancelled by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+FDM Config Diff
+Object-level comparison of two exports and delta-only import archives
+"""
+import argparse
+import json
+import sys
+from fdm_config_graph import ConfigGraph
+from fdm_config_stream import (iter_config_objects, object_digest, open_config_stream,
+                               write_config_archive)
+
+
+def object_key(obj):
+    """Identity of a config object: (type, id), falling back to (type, name)"""
+    return (obj.get('type'), obj.get('id') or obj.get('name'))
+
+
+def index_config(file_path):
+    """Stream a config and return its metadata and {key: (id, name, digest)} for every object"""
+    metadata = None
+    index = {}
+
+    with open_config_stream(file_path) as stream:
+        for obj in iter_config_objects(stream):
+            if metadata is None:
+                if obj.get('type') != 'metadata':
+                    raise ValueError(f"First object must be metadata: {file_path}")
+                metadata = obj
+                continue
+            index[object_key(obj)] = (obj.get('id'), obj.get('name'), object_digest(obj))
+
+    if metadata is None:
+        raise ValueError(f"Configuration must be a non-empty JSON array: {file_path}")
+    return metadata, index
+
+
+def diff_configs(old_path, new_path):
+    """Compare two exported configs by object identity
+
+    Returns a dict with 'added', 'changed' and 'removed' lists of
+    {'type', 'id', 'name'} entries; id is None for objects that have none
+    (they are matched by name). Only hashes are kept in memory, never
+    the objects themselves.
+    """
+    _, old_index = index_config(old_path)
+    _, new_index = index_config(new_path)
+
+    def entries(keys, index):
+        return [{'type': key[0], 'id': index[key][0], 'name': index[key][1]}
+                for key in sorted(keys, key=str)]
+
+    old_keys, new_keys = old_index.keys(), new_index.keys()
+    changed = [key for key in old_keys & new_keys if old_index[key][2] != new_index[key][2]]
+
+    return {
+        'added': entries(new_keys - old_keys, new_index),
+        'changed': entries(changed, new_index),
+        'removed': entries(old_keys - new_keys, old_index)
+    }
+
+
+def delta_entity_ids(diff):
+    """Entity ids of added and changed objects, e.g. for a PARTIAL_EXPORT (objects without an id are left out)"""
+    return [entry['id'] for entry in diff['added'] + diff['changed'] if entry['id']]
+
+
+def write_delta_archive(new_path, diff, output_path, with_dependencies=False):
+    """Write an import zip holding the metadata plus the added and changed objects
+
+    Removed objects are reported by diff_configs but not included: an import
+    creates or updates objects and never deletes them. With
+    with_dependencies, every object the delta references (directly or
+    indirectly) is included as well, and objects are written so each comes
+    after the objects it references.
+    """
+    delta = diff['added'] + diff['changed']
+    wanted = {object_key(entry) for entry in delta}
+    graph = None
+    if with_dependencies:
+        graph = ConfigGraph.from_file(new_path)
+        seeds = [graph.index[entry['id']] for entry in delta if entry['id'] in graph.index]
+        for node in graph.closure(seeds):
+            if graph.present[node]:
+                wanted.add((graph.types[node], graph.ids[node]))
+
+    def delta_objects():
+        with open_config_stream(new_path) as stream:
+            for index, obj in enumerate(iter_config_objects(stream)):
+                if index == 0 or object_key(obj) in wanted:
+                    yield obj
+
+    def ordered_objects():
+        # The delta is a small subset of the export, so it is buffered for reordering
+        objects = delta_objects()
+        yield next(objects)
+        by_node, unindexed = {}, []
+        for obj in objects:
+            node = graph.index.get(obj.get('id'))
+            if node is None:
+                unindexed.append(obj)
+            else:
+                by_node[node] = obj
+        for node in graph.import_order(list(by_node)):
+            yield by_node[node]
+        yield from unindexed
+
+    objects = ordered_objects() if graph else delta_objects()
+    # The metadata object is always written, so subtract it from the count
+    return write_config_archive(objects, output_path) - 1
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Compare two FDM config exports by object")
+    parser.add_argument('old', help="Baseline export (.zip or .json)")
+    parser.add_argument('new', help="Newer export (.zip or .json)")
+    parser.add_argument('--delta', help="Write an import zip with only added/changed objects")
+    parser.add_argument('--with-dependencies', action='store_true',
+                        help="Also put every object the delta references into the delta archive")
+    parser.add_argument('--json', action='store_true', help="Print the diff as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+        diff = diff_configs(args.old, args.new)
+
+        if args.json:
+            print(json.dumps(diff, indent=2))
+        else:
+            for label, symbol in (('added', '+'), ('changed', '~'), ('removed', '-')):
+                for entry in diff[label]:
+                    print(f"  {symbol} {entry['type']}: {entry['name'] or entry['id']}")
+            print(f"\n📊 {len(diff['added'])} added, {len(diff['changed'])} changed, "
+                  f"{len(diff['removed'])} removed")
+
+        if args.delta:
+            count = write_delta_archive(args.new, diff, args.delta, args.with_dependencies)
+            print(f"✓ Delta import archive with {count} object(s): {args.delta}")
+            if diff['removed']:
+                print("⚠ Removed objects are not part of the delta; delete them on the device manually")
+
+    except KeyboardInterrupt:
+        print("\n\n⚠ Operation cancelled by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
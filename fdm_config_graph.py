@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+FDM Config Graph
+Compact reference graph of an export: dependency closure, reverse lookups, import order
+"""
+import argparse
+import sys
+from array import array
+from collections import deque
+from fdm_config_stream import iter_config_objects, open_config_stream
+
+# Keys whose contents are never references to other objects
+_SKIP_KEYS = frozenset(('links', 'metadata'))
+
+
+def iter_references(obj):
+    """Yield (id, type, name) of every object reference nested inside obj
+
+    FDM writes references as {"id": ..., "type": ..., "name": ...}; the
+    object's own top-level id is not a reference.
+    """
+    stack = [value for key, value in obj.items() if key not in _SKIP_KEYS]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            ref_id = value.get('id')
+            if isinstance(ref_id, str) and 'type' in value:
+                yield ref_id, value.get('type'), value.get('name')
+            stack.extend(item for key, item in value.items() if key not in _SKIP_KEYS)
+        elif isinstance(value, list):
+            stack.extend(value)
+
+
+class ConfigGraph:
+    """Reference graph over the objects of one export, stored as flat arrays
+
+    Objects are numbered in file order. Outgoing (depends-on) and incoming
+    (referenced-by) edges are kept in compressed sparse row form: the
+    neighbours of node i are targets[offsets[i]:offsets[i + 1]]. Referenced
+    ids that never appear as objects become placeholder nodes marked as not
+    present (often system-defined objects that are not exported).
+    """
+
+    __slots__ = ('ids', 'types', 'names', 'present', 'index', 'by_name', 'out_offsets',
+                 'out_targets', 'in_offsets', 'in_targets', '_marks', '_stamp')
+
+    def __init__(self):
+        self.ids = []
+        self.types = []
+        self.names = []
+        self.present = bytearray()
+        self.index = {}
+        self.by_name = {}
+        self.out_offsets = self.out_targets = self.in_offsets = self.in_targets = array('I')
+        self._marks = array('I')
+        self._stamp = 0
+
+    @classmethod
+    def from_file(cls, file_path):
+        """Build the graph from an export (.zip, .json/.txt, .zst/.xz) in one streaming pass"""
+        with open_config_stream(file_path) as stream:
+            return cls.from_objects(iter_config_objects(stream))
+
+    @classmethod
+    def from_objects(cls, objects):
+        """Build the graph from a stream of config objects (metadata is skipped)"""
+        graph = cls()
+        sources, targets = array('I'), array('I')
+
+        for obj in objects:
+            if not isinstance(obj, dict) or obj.get('type') == 'metadata' or not obj.get('id'):
+                continue
+            node = graph._node(obj['id'], obj.get('type'), obj.get('name'))
+            graph.present[node] = 1
+            for ref_id, ref_type, ref_name in iter_references(obj):
+                target = graph._node(ref_id, ref_type, ref_name)
+                if target != node:
+                    sources.append(node)
+                    targets.append(target)
+
+        graph.out_offsets, graph.out_targets = _csr(len(graph.ids), sources, targets)
+        graph.in_offsets, graph.in_targets = _csr(len(graph.ids), targets, sources)
+        graph._marks = array('I', bytes(4 * len(graph.ids)))
+        return graph
+
+    def _node(self, obj_id, obj_type, name):
+        node = self.index.get(obj_id)
+        if node is None:
+            node = self.index[obj_id] = len(self.ids)
+            self.ids.append(obj_id)
+            self.types.append(obj_type)
+            self.names.append(name)
+            self.present.append(0)
+        elif self.names[node] is None and name is not None:
+            self.names[node] = name
+        else:
+            return node
+        if name is not None:
+            # The first object seen under a type/name key keeps it
+            self.by_name.setdefault((self.types[node], name), node)
+        return node
+
+    def __len__(self):
+        return len(self.ids)
+
+    def find(self, key):
+        """Node for an object id or a 'type/name' key (None if unknown)"""
+        node = self.index.get(key)
+        if node is None and '/' in key:
+            obj_type, _, name = key.partition('/')
+            node = self.by_name.get((obj_type, name))
+        return node
+
+    def describe(self, node):
+        """{'id', 'type', 'name', 'present'} for a node"""
+        return {'id': self.ids[node], 'type': self.types[node], 'name': self.names[node],
+                'present': bool(self.present[node])}
+
+    def depends_on(self, node):
+        """Nodes directly referenced by node"""
+        return self.out_targets[self.out_offsets[node]:self.out_offsets[node + 1]]
+
+    def referenced_by(self, node):
+        """Nodes that directly reference node"""
+        return self.in_targets[self.in_offsets[node]:self.in_offsets[node + 1]]
+
+    def _next_stamp(self):
+        # Marks are compared against a per-query stamp so they never need clearing
+        self._stamp += 1
+        return self._stamp
+
+    def _reach(self, nodes, offsets, targets):
+        stamp = self._next_stamp()
+        marks = self._marks
+        queue = deque()
+        for node in nodes:
+            if marks[node] != stamp:
+                marks[node] = stamp
+                queue.append(node)
+        reached = []
+        while queue:
+            node = queue.popleft()
+            reached.append(node)
+            for target in targets[offsets[node]:offsets[node + 1]]:
+                if marks[target] != stamp:
+                    marks[target] = stamp
+                    queue.append(target)
+        return reached
+
+    def closure(self, nodes):
+        """The nodes plus everything they reference, directly or indirectly"""
+        return self._reach(nodes, self.out_offsets, self.out_targets)
+
+    def dependents(self, nodes):
+        """The nodes plus everything that references them, directly or indirectly"""
+        return self._reach(nodes, self.in_offsets, self.in_targets)
+
+    def import_order(self, nodes):
+        """Order a set of nodes so every object comes after the objects it references
+
+        Ties keep file order. Nodes on a reference cycle are appended in
+        file order after everything else.
+        """
+        stamp = self._next_stamp()
+        marks = self._marks
+        for node in nodes:
+            marks[node] = stamp
+
+        pending = {}
+        ready = []
+        for node in sorted(set(nodes)):
+            count = sum(1 for target in self.depends_on(node) if marks[target] == stamp and target != node)
+            if count:
+                pending[node] = count
+            else:
+                ready.append(node)
+
+        order = []
+        ready = deque(ready)
+        while ready:
+            node = ready.popleft()
+            order.append(node)
+            for dependent in sorted(self.referenced_by(node)):
+                if dependent in pending:
+                    pending[dependent] -= 1
+                    if not pending[dependent]:
+                        del pending[dependent]
+                        ready.append(dependent)
+        return order + sorted(pending)
+
+
+def _csr(count, sources, targets):
+    """Compressed sparse row arrays (offsets, targets) for edges sources[i] -> targets[i]"""
+    offsets = array('I', bytes(4 * (count + 1)))
+    for source in sources:
+        offsets[source + 1] += 1
+    for node in range(count):
+        offsets[node + 1] += offsets[node]
+
+    ordered = array('I', bytes(4 * len(targets)))
+    fill = array('I', offsets)
+    for source, target in zip(sources, targets):
+        ordered[fill[source]] = target
+        fill[source] += 1
+    return offsets, ordered
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Explore object references in an FDM export")
+    parser.add_argument('config', help="Export (.zip, .json/.txt, .zst/.xz)")
+    parser.add_argument('objects', nargs='+', help="Object ids or type/name keys")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--deps', action='store_true', help="Dependency closure in import order (default)")
+    mode.add_argument('--refs', action='store_true', help="Everything that references the objects")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+        graph = ConfigGraph.from_file(args.config)
+        print(f"🔗 {len(graph)} objects, {len(graph.out_targets)} references")
+
+        nodes = []
+        for key in args.objects:
+            node = graph.find(key)
+            if node is None:
+                raise ValueError(f"Object not found: {key}")
+            nodes.append(node)
+
+        if args.refs:
+            result = [node for node in graph.dependents(nodes) if node not in nodes]
+            print(f"\n📊 {len(result)} object(s) reference {', '.join(args.objects)}:")
+        else:
+            result = graph.import_order(graph.closure(nodes))
+            print(f"\n📊 Dependency closure ({len(result)} objects, import order):")
+
+        for node in result:
+            info = graph.describe(node)
+            marker = '' if info['present'] else '  (not in export)'
+            print(f"  • {info['type']} {info['name'] or info['id']}{marker}")
+
+    except KeyboardInterrupt:
+        print("\n\n⚠ Operation cancelled by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
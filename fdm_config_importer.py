@@ -1,11 +1,74 @@
 #!/usr/bin/env python3
 import getpass
+import itertools
 import sys
-import time
 import json
+import shutil
+import uuid
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from fdm_base_client import FDMBaseClient
+from fdm_backup_crypto import is_encrypted, open_encrypted, plain_name
+from fdm_base_client import FDMBaseClient, SizedBody
+from fdm_config_stream import (find_config_member, iter_zipped_config, open_config_stream,
+                               read_config_metadata, summarize_config)
+from fdm_job_tracker import WAIT_GRACE
+from fdm_metrics import METRICS
+
+UPLOAD_CHUNK_SIZE = 256 * 1024
+# Uploads that come to at most this size are buffered in memory and sent with a
+# Content-Length; larger ones are sent chunked as they are produced
+UPLOAD_SPOOL_THRESHOLD = 32 * 1024 * 1024
+
+# Pre-flight requests are small reads; a device that cannot answer them quickly
+# would not get through an import either
+PREFLIGHT_TIMEOUT = 10
+PREFLIGHT_JOB_LIMIT = 25
+ACTIVE_JOB_STATES = ('QUEUED', 'PENDING', 'RUNNING', 'IN_PROGRESS')
+ACTIVE_DEPLOY_STATES = ('QUEUED', 'PRE_DEPLOYMENT_CHECKS', 'DEPLOYING')
+DEPLOY_SUCCESS_STATES = ('DEPLOYED',)
+DEPLOY_FAILURE_STATES = ('DEPLOY_FAILED', 'DEPLOY_CANCELLED', 'FAILED')
+
+
+def iter_multipart_body(boundary, field_name, filename, mime_type, content):
+    """Yield a multipart/form-data body around content (bytes or an iterable of chunks)"""
+    yield (f'--{boundary}\r\n'
+           f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+           f'Content-Type: {mime_type}\r\n\r\n').encode()
+    if isinstance(content, bytes):
+        yield content
+    else:
+        yield from content
+    yield f'\r\n--{boundary}--\r\n'.encode()
+
+
+def release_of(version):
+    """Release part of an FDM version string ('7.4.2-172' -> '7.4.2')"""
+    return (version or '').split('-')[0]
+
+
+def spool_chunks(chunks, limit=UPLOAD_SPOOL_THRESHOLD):
+    """Join chunks into bytes if they total at most limit, else iterate over all of them
+
+    Only the bytes actually produced are counted, so a small compressed or
+    encrypted file that expands past limit is still streamed.
+    """
+    chunks = iter(chunks)
+    buffered = []
+    size = 0
+    for chunk in chunks:
+        buffered.append(chunk)
+        size += len(chunk)
+        if size > limit:
+            return itertools.chain(buffered, chunks)
+    return b''.join(buffered)
+
+
+def _count_chunks(chunks, counter):
+    """Pass chunks through, adding their sizes to counter[0]"""
+    for chunk in chunks:
+        counter[0] += len(chunk)
+        yield chunk
 
 
 class FDMConfigImporter(FDMBaseClient):
@@ -26,22 +89,13 @@ class FDMConfigImporter(FDMBaseClient):
                 file_list = zip_ref.namelist()
                 print(f"   Files in archive: {', '.join(file_list)}")
                 
-                # Find the JSON config file (usually the only file or named config.json)
-                json_file = None
-                for fname in file_list:
-                    if fname.endswith('.json') or fname == 'config' or not '.' in fname:
-                        json_file = fname
-                        break
-                
-                if not json_file:
-                    json_file = file_list[0]  # Use first file if no obvious config found
+                json_file = find_config_member(zip_ref)
                 
                 # Extract to temporary file
-                extracted_content = zip_ref.read(json_file)
                 temp_path = zip_path.parent / f"{zip_path.stem}_extracted.json"
                 
-                with open(temp_path, 'wb') as f:
-                    f.write(extracted_content)
+                with zip_ref.open(json_file) as src, open(temp_path, 'wb') as f:
+                    shutil.copyfileobj(src, f)
                 
                 print(f"✓ Extracted to: {temp_path}")
                 return str(temp_path)
@@ -53,52 +107,70 @@ class FDMConfigImporter(FDMBaseClient):
             print(f"✗ Extraction failed: {e}")
             return None
     
+    @METRICS.phase('upload')
+    def upload_config_stream(self, upload_name, content):
+        """Upload zip archive bytes (bytes or an iterable of chunks) to FDM
+
+        bytes are sent as they are between the multipart header and footer,
+        so many uploads of one shared payload don't each copy it.
+        """
+        boundary = uuid.uuid4().hex
+        body = iter_multipart_body(boundary, 'fileToUpload', upload_name, 'application/zip', content)
+        sent = [0]
+        if isinstance(content, bytes):
+            body = SizedBody(body)
+            sent[0] = len(body)
+        elif METRICS.enabled:
+            body = _count_chunks(body, sent)
+        
+        headers = {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+        response = self._make_request('POST', 'action/uploadconfigfile', 
+                                     data=body, headers=headers, timeout=60)
+        METRICS.annotate(bytes=sent[0])
+        return response.json()
+    
     def upload_config_file(self, file_path):
-        """Upload configuration file to FDM (uploads .zip directly, extracts .txt/.json to zip first)"""
+        """Upload configuration file to FDM (uploads .zip directly, zips .txt/.json/.zst/.xz on the fly)
+        
+        Encrypted backups (.enc) are decrypted into the request body as it is
+        sent, without writing the plaintext to disk.
+        """
         try:
             file_path = Path(file_path)
             if not file_path.exists():
                 print(f"✗ File not found: {file_path}")
                 return None
             
-            # Determine upload path and MIME type
-            if file_path.suffix.lower() == '.zip':
-                # Upload .zip files directly
-                upload_path = file_path
-                mime_type = 'application/zip'
+            is_zip = plain_name(file_path).suffix.lower() == '.zip'
+            if is_zip and is_encrypted(file_path):
+                opener = open_encrypted(file_path)
+            elif is_zip:
+                opener = open(file_path, 'rb')
             else:
-                # For .txt or .json files, we need to create a temporary .zip
-                print(f"📦 Creating ZIP archive from: {file_path.name}")
-                upload_path = file_path.parent / f"{file_path.stem}.zip"
-                
-                with zipfile.ZipFile(upload_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
-                    # Add the config file to zip with a standard name
-                    zip_ref.write(file_path, 'full_config.txt')
-                
-                mime_type = 'application/zip'
-                print(f"✓ Created: {upload_path.name}")
-            
-            print(f"📤 Uploading configuration file: {upload_path.name}")
+                opener = open_config_stream(file_path)
             
-            with open(upload_path, 'rb') as f:
-                files = {'fileToUpload': (upload_path.name, f, mime_type)}
-                response = self._make_request('POST', 'action/uploadconfigfile', 
-                                             files=files, timeout=60)
+            with opener as source:
+                if is_zip:
+                    # Upload .zip files directly
+                    upload_name = plain_name(file_path).name
+                    content = iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b'')
+                else:
+                    # For .txt/.json files and .zst/.xz repacked backups, compress the
+                    # config into the request body as it is sent
+                    print(f"📦 Compressing {file_path.name} into ZIP upload stream")
+                    upload_name = f"{plain_name(file_path).stem}.zip"
+                    content = iter_zipped_config(source, chunk_size=UPLOAD_CHUNK_SIZE)
+                
+                print(f"📤 Uploading configuration file: {upload_name}")
+                result = self.upload_config_stream(upload_name, spool_chunks(content))
             
-            result = response.json()
             print(f"✓ Upload successful: {result['diskFileName']} ({result.get('sizeBytes', 0):,} bytes)")
-            
-            # Clean up temporary zip file if we created one
-            if file_path.suffix.lower() != '.zip' and upload_path.exists():
-                upload_path.unlink()
-                print(f"🗑️  Cleaned up temporary file: {upload_path.name}")
-            
             return result['diskFileName']
         except Exception as e:
             print(f"✗ Upload failed: {e}")
             return None
-            return None
     
+    @METRICS.phase('import')
     def import_configuration(self, disk_filename, auto_deploy=False, 
                            allow_pending_changes=False, preserve_file=True):
         """Import configuration from uploaded file"""
@@ -125,67 +197,168 @@ class FDMConfigImporter(FDMBaseClient):
     
     def check_import_status(self, job_id):
         """Check import job status"""
-        try:
-            response = self._make_request('GET', f'jobs/configimportstatus/{job_id}')
-            return response.json()
-        except Exception as e:
-            # Job status endpoint may return 404 if job is complete or not found
-            if hasattr(e, 'response') and hasattr(e.response, 'status_code') and e.response.status_code == 404:
-                return None
-            print(f"✗ Failed to check import status: {e}")
-            return None
+        return self.check_job_status('jobs/configimportstatus', job_id, 'import')
     
+    @METRICS.phase('import_wait')
     def wait_for_import_completion(self, job_id, timeout=600):
         """Wait for import job to complete"""
-        start_time = time.time()
-        
-        while time.time() - start_time < timeout:
-            status_data = self.check_import_status(job_id)
-            
-            if not status_data:
-                print(f"⚠ Job status not available")
-                time.sleep(10)
-                continue
-            
+        def on_update(status_data):
             status = status_data.get('status', 'UNKNOWN')
-            message = status_data.get('statusMessage', '')
-            
-            if status == 'SUCCESS':
-                print(f"✓ Import completed successfully!")
-                if status_data.get('autoDeploy'):
-                    print("✓ Configuration deployed automatically")
-                return status_data
-            elif status in ['FAILED', 'ERROR']:
-                # Check for pending deployment error
-                if 'objects to be deployed' in message or 'pending' in message.lower():
-                    print(f"✗ Import failed: {message}")
-                    print("\n⚠️  RESOLUTION: There are pending deployments on the FDM device.")
-                    print("   Please deploy or discard pending changes before importing:")
-                    print("   1. Log into FDM web interface")
-                    print("   2. Go to Deploy > Deployment")
-                    print("   3. Either 'Deploy' or 'Discard' pending changes")
-                    print("   4. Try running the import again")
-                else:
-                    print(f"✗ Import failed: {message}")
-                
-                messages = status_data.get('messages', [])
-                if messages:
-                    print("\nError details:")
-                    for msg in messages:
-                        print(f"  • {msg}")
-                return None
-            elif status in ['RUNNING', 'QUEUED', 'PENDING']:
+            if status in ['RUNNING', 'QUEUED', 'PENDING']:
                 print(f"⏳ Import in progress... ({status})")
             else:
-                print(f"ℹ Import status: {status} - {message}")
-            
-            time.sleep(10)
+                print(f"ℹ Import status: {status} - {status_data.get('statusMessage', '')}")
+        
+        future = self.track_job('jobs/configimportstatus', job_id, timeout=timeout,
+                                label='import', on_update=on_update)
+        status_data = self.job_tracker.wait(future, timeout + WAIT_GRACE)
+        
+        if not status_data:
+            print(f"✗ Import timeout after {timeout} seconds")
+            return None
+        
+        status = status_data.get('status', 'UNKNOWN')
+        message = status_data.get('statusMessage', '')
+        
+        if status == 'SUCCESS':
+            print(f"✓ Import completed successfully!")
+            if status_data.get('autoDeploy'):
+                print("✓ Configuration deployed automatically")
+            return status_data
         
-        print(f"✗ Import timeout after {timeout} seconds")
+        # Check for pending deployment error
+        if 'objects to be deployed' in message or 'pending' in message.lower():
+            print(f"✗ Import failed: {message}")
+            print("\n⚠️  RESOLUTION: There are pending deployments on the FDM device.")
+            print("   Please deploy or discard pending changes before importing:")
+            print("   1. Log into FDM web interface")
+            print("   2. Go to Deploy > Deployment")
+            print("   3. Either 'Deploy' or 'Discard' pending changes")
+            print("   4. Try running the import again")
+        else:
+            print(f"✗ Import failed: {message}")
+        
+        messages = status_data.get('messages', [])
+        if messages:
+            print("\nError details:")
+            for msg in messages:
+                print(f"  • {msg}")
+        return None
+    
+    def get_active_jobs(self, endpoint, status_key='status', active_states=ACTIVE_JOB_STATES):
+        """Recent jobs from a job listing endpoint that have not finished yet"""
+        response = self._make_request('GET', endpoint, params={'limit': PREFLIGHT_JOB_LIMIT},
+                                      timeout=PREFLIGHT_TIMEOUT)
+        return [job for job in response.json().get('items', [])
+                if job.get(status_key) in active_states]
+    
+    def get_system_info(self):
+        """Software version and platform model of the device"""
+        response = self._make_request('GET', 'operational/systeminfo/default', timeout=PREFLIGHT_TIMEOUT)
+        return response.json()
+    
+    def preflight_problems(self, metadata, allow_pending_changes=False):
+        """Reasons an import of a config with this metadata would fail (empty list if none)
+        
+        Pending changes, running imports and deployments, and the device's
+        version and model are fetched concurrently, so the whole check costs
+        about one round trip. A device that cannot answer counts as a problem.
+        """
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            checks = {
+                'pending changes': pool.submit(self.get_pending_changes, PREFLIGHT_TIMEOUT),
+                'running imports': pool.submit(self.get_active_jobs, 'jobs/configimportstatus'),
+                'running deployments': pool.submit(self.get_active_jobs, 'operational/deploy',
+                                                   'state', ACTIVE_DEPLOY_STATES),
+                'system info': pool.submit(self.get_system_info)
+            }
+        
+        problems = []
+        results = {}
+        for name, future in checks.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                problems.append(f"Could not read {name}: {e}")
+        
+        if results.get('pending changes') and not allow_pending_changes:
+            problems.append(f"{results['pending changes']} pending change(s) on the device; "
+                            "deploy or discard them first")
+        for name in ('running imports', 'running deployments'):
+            if results.get(name):
+                problems.append(f"{len(results[name])} {name[:-1]}(s) in progress; wait for them to finish")
+        
+        system_info = results.get('system info')
+        if system_info:
+            device_model = system_info.get('platformModel')
+            config_model = metadata.get('hardwareModel')
+            if device_model and config_model and device_model != config_model:
+                problems.append(f"Config is from a {config_model}, device is a {device_model}")
+            device_version = system_info.get('softwareVersion')
+            config_version = metadata.get('softwareVersion')
+            if device_version and config_version and release_of(device_version) != release_of(config_version):
+                problems.append(f"Config is from version {config_version}, device runs {device_version}")
+        return problems
+    
+    @METRICS.phase('preflight')
+    def preflight_check(self, file_path, allow_pending_changes=False):
+        """Refuse early, before anything is uploaded, if the import would fail"""
+        try:
+            print("🛫 Checking device state before upload...")
+            problems = self.preflight_problems(read_config_metadata(file_path), allow_pending_changes)
+        except Exception as e:
+            print(f"✗ Pre-flight check failed: {e}")
+            return False
+        
+        if problems:
+            print("✗ Import would fail:")
+            for problem in problems:
+                print(f"   • {problem}")
+            return False
+        print("✓ Device is ready for import")
+        return True
+    
+    @METRICS.phase('deploy')
+    def deploy_configuration(self):
+        """Start deploying the pending changes; returns the deployment id"""
+        try:
+            print("🚀 Starting deployment...")
+            response = self._make_request('POST', 'operational/deploy')
+            deploy_id = response.json().get('id')
+            print(f"✓ Deployment started: {deploy_id}")
+            return deploy_id
+        except Exception as e:
+            print(f"✗ Deployment could not be started: {e}")
+            return None
+    
+    @METRICS.phase('deploy_wait')
+    def wait_for_deploy_completion(self, deploy_id, timeout=900):
+        """Wait for a deployment to finish"""
+        def on_update(status_data):
+            print(f"⏳ Deployment in progress... ({status_data.get('state', 'UNKNOWN')})")
+        
+        future = self.track_job('operational/deploy', deploy_id, timeout=timeout, label='deploy',
+                                on_update=on_update, status_key='state',
+                                success_states=DEPLOY_SUCCESS_STATES,
+                                failure_states=DEPLOY_FAILURE_STATES)
+        status_data = self.job_tracker.wait(future, timeout + WAIT_GRACE)
+        
+        if not status_data:
+            print(f"✗ Deployment timeout after {timeout} seconds")
+            return None
+        if status_data.get('state') in DEPLOY_SUCCESS_STATES:
+            print("✓ Deployment completed successfully!")
+            return status_data
+        print(f"✗ Deployment failed: {status_data.get('state')} {status_data.get('statusMessage', '')}")
         return None
     
+    @METRICS.phase('validate')
     def validate_config_file(self, file_path):
-        """Validate configuration file format (handles both .zip and JSON files)"""
+        """Validate configuration file format (handles both .zip and JSON files)
+        
+        The config is streamed object by object, so memory use stays flat and
+        no extracted copy is written to disk.
+        """
         try:
             file_path = Path(file_path)
             if not file_path.exists():
@@ -193,47 +366,25 @@ class FDMConfigImporter(FDMBaseClient):
                 return False
             
             print(f"🔍 Validating configuration file: {file_path.name}")
+            summary = summarize_config(file_path)
             
-            # If it's a .zip file, extract and validate the contents
-            if file_path.suffix.lower() == '.zip':
-                extracted_path = self.extract_zip_config(file_path)
-                if not extracted_path:
-                    return False
-                validate_path = Path(extracted_path)
-            else:
-                validate_path = file_path
-            
-            with open(validate_path, 'r') as f:
-                config_data = json.load(f)
-            
-            if not isinstance(config_data, list) or not config_data:
-                print("✗ Configuration must be a non-empty JSON array")
-                # Clean up if we extracted
-                if file_path.suffix.lower() == '.zip' and validate_path.exists():
-                    validate_path.unlink()
-                return False
-            
-            if config_data[0].get('type') != 'metadata':
-                print("✗ First object must be metadata")
-                # Clean up if we extracted
-                if file_path.suffix.lower() == '.zip' and validate_path.exists():
-                    validate_path.unlink()
-                return False
-            
-            metadata = config_data[0]
+            metadata = summary['metadata']
             print(f"✓ Valid configuration file:")
             print(f"   • Hardware Model: {metadata.get('hardwareModel', 'Unknown')}")
             print(f"   • Software Version: {metadata.get('softwareVersion', 'Unknown')}")
-            print(f"   • Objects: {len(config_data)} total")
-            
-            # Clean up temporary extracted file if we created one
-            if file_path.suffix.lower() == '.zip' and validate_path.exists():
-                validate_path.unlink()
+            print(f"   • Objects: {summary['objectCount']} total")
+            print(f"   • Object types: {len(summary['types'])}")
             
             return True
+        except zipfile.BadZipFile:
+            print(f"✗ Invalid ZIP file: {file_path}")
+            return False
         except json.JSONDecodeError as e:
             print(f"✗ Invalid JSON format: {e}")
             return False
+        except ValueError as e:
+            print(f"✗ {e}")
+            return False
         except Exception as e:
             print(f"✗ Validation failed: {e}")
             return False
@@ -248,7 +399,8 @@ def find_config_file(file_input):
         return str(config_path)
     
     print(f"✗ File not found: {file_input}")
-    config_files = list(Path('.').glob('*.txt')) + list(Path('.').glob('*.json')) + list(Path('.').glob('*.zip'))
+    config_files = [path for pattern in ('*.txt', '*.json', '*.zip', '*.zst', '*.xz', '*.enc')
+                    for path in Path('.').glob(pattern)]
     
     if not config_files:
         print("No configuration files found")
@@ -280,23 +432,30 @@ def get_user_inputs():
     if not config_file:
         sys.exit(1)
     
+    deploy = input("Deploy after import? (y/N): ").strip().lower() in ('y', 'yes')
+    
     # Default settings
     print(f"\nUsing default import settings:")
     print(f"  • Auto-deploy: False")
     print(f"  • Allow pending changes: False")
     print(f"  • Keep uploaded file: True")
+    print(f"  • Deploy after import: {deploy}")
     
-    return host, username, password, config_file
+    return host, username, password, config_file, deploy
 
 
 def main():
     try:
-        host, username, password, config_file = get_user_inputs()
+        host, username, password, config_file, deploy = get_user_inputs()
         
+        METRICS.configure_from_env()
         client = FDMConfigImporter(host)
         if not client.authenticate(username, password):
             sys.exit(1)
         
+        if not client.preflight_check(config_file):
+            sys.exit(1)
+        
         if not client.validate_config_file(config_file):
             sys.exit(1)
         
@@ -317,6 +476,12 @@ def main():
             print("║" + " " * 10 + "🎉 CONFIGURATION IMPORT COMPLETED SUCCESSFULLY! 🎉" + " " * 7 + "║")
             print("║" + " " * 68 + "║")
             print("=" * 70)
+            if deploy:
+                deploy_id = client.deploy_configuration()
+                if not deploy_id or not client.wait_for_deploy_completion(deploy_id):
+                    print("\n✗ Configuration imported but deployment failed; deploy it from the FDM GUI")
+                    sys.exit(1)
+                return
             print("\n⚠️  IMPORTANT: Configuration imported but NOT deployed yet")
             print("   Manual deployment required to activate changes:")
             print("   1. Log into FDM web interface")
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+FDM Config Index
+SQLite index of exported config objects, queryable by device, snapshot, type, id and name
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import zlib
+from datetime import datetime
+from pathlib import Path
+from fdm_config_stream import canonical_json, iter_config_objects, open_config_stream
+
+INSERT_BATCH_SIZE = 1000
+ARCHIVE_SUFFIXES = ('.zip', '.zst', '.xz', '.enc')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    path TEXT NOT NULL UNIQUE,
+    mtime REAL NOT NULL,
+    taken_at REAL NOT NULL,
+    software_version TEXT,
+    hardware_model TEXT,
+    object_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bodies (
+    digest TEXT PRIMARY KEY,
+    body BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS objects (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    type TEXT,
+    obj_id TEXT,
+    name TEXT,
+    digest TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_type_name ON objects(type, name);
+CREATE INDEX IF NOT EXISTS objects_name ON objects(name);
+CREATE INDEX IF NOT EXISTS objects_obj_id ON objects(obj_id);
+CREATE INDEX IF NOT EXISTS objects_snapshot ON objects(snapshot_id);
+CREATE INDEX IF NOT EXISTS snapshots_device_time ON snapshots(device, taken_at);
+"""
+
+
+class FDMConfigIndex:
+    """Indexes archives written by download_config_file for millisecond lookups
+
+    Every object row records its snapshot, type, id and name; object bodies
+    are stored once per distinct content (zlib-compressed canonical JSON) so
+    a year of mostly unchanged nightly backups stays small.
+    """
+
+    def __init__(self, db_path='fdm_index.db'):
+        self.db = sqlite3.connect(str(db_path))
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA foreign_keys=ON')
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        """Close the index database"""
+        self.db.close()
+
+    def ingest(self, archive_path, device=None):
+        """Index one archive; returns its object count, or None if already indexed
+
+        The device defaults to the archive's parent directory name, matching
+        the <output-dir>/<host>/ layout of the fleet exporter.
+        """
+        archive_path = Path(archive_path).resolve()
+        device = device or archive_path.parent.name
+        mtime = archive_path.stat().st_mtime
+
+        row = self.db.execute('SELECT id, mtime FROM snapshots WHERE path = ?',
+                              (str(archive_path),)).fetchone()
+        if row and row[1] == mtime:
+            return None
+
+        with self.db:
+            if row:
+                self.db.execute('DELETE FROM snapshots WHERE id = ?', (row[0],))
+
+            cursor = self.db.execute(
+                'INSERT INTO snapshots (device, path, mtime, taken_at, object_count) '
+                'VALUES (?, ?, ?, ?, 0)', (device, str(archive_path), mtime, mtime))
+            snapshot_id = cursor.lastrowid
+            metadata = None
+            count = 0
+            bodies, rows = [], []
+
+            def flush():
+                self.db.executemany('INSERT OR IGNORE INTO bodies VALUES (?, ?)', bodies)
+                self.db.executemany('INSERT INTO objects VALUES (?, ?, ?, ?, ?)', rows)
+                bodies.clear()
+                rows.clear()
+
+            with open_config_stream(archive_path) as stream:
+                for obj in iter_config_objects(stream):
+                    if metadata is None:
+                        metadata = obj
+                    data = canonical_json(obj)
+                    digest = hashlib.sha256(data).hexdigest()
+                    bodies.append((digest, zlib.compress(data)))
+                    rows.append((snapshot_id, obj.get('type'), obj.get('id'), obj.get('name'), digest))
+                    count += 1
+                    if len(rows) >= INSERT_BATCH_SIZE:
+                        flush()
+            flush()
+
+            metadata = metadata or {}
+            self.db.execute('UPDATE snapshots SET software_version = ?, hardware_model = ?, '
+                            'object_count = ? WHERE id = ?',
+                            (metadata.get('softwareVersion'), metadata.get('hardwareModel'),
+                             count, snapshot_id))
+        return count
+
+    def query(self, obj_type=None, name=None, obj_id=None, device=None, at=None, pattern=False):
+        """Find objects; yields dicts with device, snapshot path/time and the object
+
+        With at (a Unix timestamp) only each device's latest snapshot taken
+        at or before that time is searched. With pattern, name is a SQL LIKE
+        pattern ('%' and '_' wildcards) instead of an exact match.
+        """
+        where, params = [], []
+        if obj_type:
+            where.append('o.type = ?')
+            params.append(obj_type)
+        if name:
+            where.append('o.name LIKE ?' if pattern else 'o.name = ?')
+            params.append(name)
+        if obj_id:
+            where.append('o.obj_id = ?')
+            params.append(obj_id)
+        if device:
+            where.append('s.device = ?')
+            params.append(device)
+        if at is not None:
+            where.append('s.taken_at = (SELECT MAX(taken_at) FROM snapshots s2 '
+                         'WHERE s2.device = s.device AND s2.taken_at <= ?)')
+            params.append(at)
+
+        sql = ('SELECT s.device, s.path, s.taken_at, b.body FROM objects o '
+               'JOIN snapshots s ON s.id = o.snapshot_id JOIN bodies b ON b.digest = o.digest')
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY s.device, s.taken_at'
+
+        for device_name, path, taken_at, body in self.db.execute(sql, params):
+            yield {
+                'device': device_name,
+                'snapshot': path,
+                'takenAt': taken_at,
+                'object': json.loads(zlib.decompress(body))
+            }
+
+
+def iter_archives(paths):
+    """Expand files and directories into the .zip/.zst/.xz/.enc archives they contain"""
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from sorted(p for p in path.rglob('*') if p.suffix.lower() in ARCHIVE_SUFFIXES)
+        else:
+            yield path
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Index and query FDM config backups")
+    parser.add_argument('--db', default='fdm_index.db', help="Index database path")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest = commands.add_parser('ingest', help="Index backup archives")
+    ingest.add_argument('paths', nargs='+', help="Archives or directories of archives")
+    ingest.add_argument('--device', help="Device name (default: archive's parent directory)")
+
+    query = commands.add_parser('query', help="Find objects in indexed backups")
+    query.add_argument('--type', help="Object type, e.g. networkobject")
+    query.add_argument('--name', help="Object name ('%%' wildcards with --like)")
+    query.add_argument('--id', help="Object id")
+    query.add_argument('--device', help="Only this device")
+    query.add_argument('--at', help="Search each device's latest backup at this time (YYYY-MM-DD[THH:MM])")
+    query.add_argument('--like', action='store_true', help="Treat --name as a LIKE pattern")
+    query.add_argument('--full', action='store_true', help="Print full object JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+        index = FDMConfigIndex(args.db)
+
+        if args.command == 'ingest':
+            for archive in iter_archives(args.paths):
+                count = index.ingest(archive, args.device)
+                if count is None:
+                    print(f"  • {archive} (unchanged, skipped)")
+                else:
+                    print(f"✓ Indexed {archive}: {count} objects")
+        else:
+            at = datetime.fromisoformat(args.at).timestamp() if args.at else None
+            matches = 0
+            for match in index.query(args.type, args.name, args.id, args.device, at, args.like):
+                matches += 1
+                obj = match['object']
+                taken = datetime.fromtimestamp(match['takenAt']).strftime('%Y-%m-%d %H:%M')
+                print(f"  • {match['device']} @ {taken}: {obj.get('type')} "
+                      f"{obj.get('name') or obj.get('id')}")
+                if args.full:
+                    print(json.dumps(obj, indent=2))
+            print(f"\n📊 {matches} match(es)")
+
+        index.close()
+
+    except KeyboardInterrupt:
+        print("\n\n⚠ Operation cancelled by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,72 @@
 #!/usr/bin/env python3
 import getpass
+import hashlib
+import io
+import os
 import sys
-import time
+import zipfile
 from pathlib import Path
-from fdm_base_client import FDMBaseClient
+import requests.exceptions
+from fdm_backup_crypto import ENCRYPTED_SUFFIX, StreamEncryptor, open_encrypted
+from fdm_base_client import FDMBaseClient, parse_fdm_time
+from fdm_config_stream import ZipStreamVerifier
+from fdm_job_tracker import WAIT_GRACE
+from fdm_metrics import METRICS
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Errors after which a download is resumed with a Range request
+RESUMABLE_ERRORS = (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout)
+# Recent deployments looked at for the change fingerprint
+FINGERPRINT_DEPLOY_LIMIT = 10
+FINGERPRINT_TIMEOUT = 10
 
 
 class FDMConfigRetriever(FDMBaseClient):
     """Handles FDM configuration export operations"""
     
-    def export_configuration(self, disk_filename=None):
-        """Export FDM full configuration"""
+    def get_change_fingerprint(self):
+        """Cheap marker of the device's configuration, or None when it can't be trusted
+        
+        Built from the latest successful deployment, which changes whenever
+        the running configuration does. A device with undeployed changes has
+        no fingerprint, since a full export includes those changes too.
+        Deployments are requested newest first; when the page doesn't hold
+        them all and isn't in that order, the latest one can't be known and
+        there is no fingerprint either.
+        """
+        try:
+            if self.get_pending_changes(timeout=FINGERPRINT_TIMEOUT):
+                return None
+            response = self._make_request('GET', 'operational/deploy',
+                                          params={'limit': FINGERPRINT_DEPLOY_LIMIT, 'sort': '-endTime'},
+                                          timeout=FINGERPRINT_TIMEOUT)
+            data = response.json()
+            items = data.get('items', [])
+            total = data.get('paging', {}).get('count')
+            if total is None or total > len(items):
+                ended = [parse_fdm_time(item.get('endTime')) for item in items]
+                ended = [end for end in ended if end is not None]
+                if ended != sorted(ended, reverse=True):
+                    return None
+            
+            deployed = [item for item in items
+                        if item.get('state') == 'DEPLOYED' and item.get('id')
+                        and parse_fdm_time(item.get('endTime')) is not None]
+            if not deployed:
+                return None
+            latest = max(deployed, key=lambda item: parse_fdm_time(item['endTime']))
+            return f"{latest['id']}@{latest['endTime']}"
+        except Exception as e:
+            print(f"⚠ Could not read change fingerprint: {e}")
+            return None
+    
+    @METRICS.phase('export')
+    def export_configuration(self, disk_filename=None, entity_ids=None):
+        """Export FDM configuration (full, or partial when entity_ids are given)"""
         payload = {
-            "configExportType": "FULL_EXPORT",
+            "configExportType": "PARTIAL_EXPORT" if entity_ids else "FULL_EXPORT",
             "type": "scheduleconfigexport",
             "doNotEncrypt": True,
             "deployedObjectsOnly": False
@@ -20,9 +74,14 @@ class FDMConfigRetriever(FDMBaseClient):
         
         if disk_filename:
             payload["diskFileName"] = disk_filename
+        if entity_ids:
+            payload["entityIds"] = list(entity_ids)
         
         try:
-            print("📤 Starting full configuration export...")
+            if entity_ids:
+                print(f"📤 Starting partial configuration export ({len(payload['entityIds'])} entities)...")
+            else:
+                print("📤 Starting full configuration export...")
             response = self._make_request('POST', 'action/configexport', json=payload)
             job_id = response.json().get('id')
             print(f"✓ Export job created: {job_id}")
@@ -33,67 +92,174 @@ class FDMConfigRetriever(FDMBaseClient):
     
     def check_export_status(self, job_id):
         """Check export job status"""
-        try:
-            response = self._make_request('GET', f'jobs/configexportstatus/{job_id}')
-            return response.json()
-        except Exception as e:
-            # Job status endpoint may return 404 if job is complete or not found
-            if hasattr(e, 'response') and hasattr(e.response, 'status_code') and e.response.status_code == 404:
-                return None
-            print(f"✗ Failed to check export status: {e}")
-            return None
+        return self.check_job_status('jobs/configexportstatus', job_id, 'export')
     
+    @METRICS.phase('export_wait')
     def wait_for_export_completion(self, job_id, timeout=300):
         """Wait for export job to complete"""
-        start_time = time.time()
-        initial_files = [f['diskFileName'] for f in self.list_config_files()]
+        try:
+            initial_files = set(self.config_file_index(max_age=0))
+        except Exception as e:
+            print(f"⚠ Could not list configuration files: {e}")
+            initial_files = set()
         
-        while time.time() - start_time < timeout:
+        def poll():
             status_data = self.check_export_status(job_id)
-            
             if status_data:
-                status = status_data.get('status', 'UNKNOWN')
-                if status == 'SUCCESS':
-                    print(f"✓ Export completed: {status_data.get('diskFileName')}")
-                    return status_data
-                elif status in ['FAILED', 'ERROR']:
-                    print(f"✗ Export failed: {status_data.get('statusMessage')}")
-                    return None
-                elif status in ['RUNNING', 'QUEUED', 'PENDING']:
-                    print(f"⏳ Export in progress... ({status})")
-            else:
-                # Check for new files if status unavailable
-                current_files = [f['diskFileName'] for f in self.list_config_files()]
-                new_files = [f for f in current_files if f not in initial_files]
-                
-                if new_files:
-                    print(f"✓ Found new export file: {new_files[-1]}")
-                    return {'status': 'SUCCESS', 'diskFileName': new_files[-1]}
+                return status_data
             
-            time.sleep(5)
+            # Status unavailable: look for a file that appeared since the export started
+            try:
+                current = self.config_file_index()
+            except Exception:
+                return None
+            new_files = current.keys() - initial_files
+            if new_files:
+                newest = max(new_files,
+                             key=lambda name: parse_fdm_time(current[name].get('dateModified')) or 0)
+                print(f"✓ Found new export file: {newest}")
+                return {'status': 'SUCCESS', 'diskFileName': newest}
+            return None
+        
+        def on_update(status_data):
+            status = status_data.get('status', 'UNKNOWN')
+            if status in ['RUNNING', 'QUEUED', 'PENDING']:
+                print(f"⏳ Export in progress... ({status})")
+        
+        future = self.job_tracker.watch(poll, timeout=timeout, on_update=on_update, label='export')
+        status_data = self.job_tracker.wait(future, timeout + WAIT_GRACE)
+        
+        if not status_data:
+            print(f"✗ Export timeout after {timeout} seconds")
+            return None
         
-        print(f"✗ Export timeout after {timeout} seconds")
+        if status_data.get('status') == 'SUCCESS':
+            print(f"✓ Export completed: {status_data.get('diskFileName')}")
+            return status_data
+        
+        print(f"✗ Export failed: {status_data.get('statusMessage')}")
         return None
     
-    def download_config_file(self, filename, output_dir="."):
-        """Download configuration file from FDM (keeps original .zip format)"""
+    @staticmethod
+    def _open_zip_for_check(part_path, encryption_key):
+        """Open a downloaded zip with zipfile, decrypting it into memory if needed"""
+        if not encryption_key:
+            return zipfile.ZipFile(part_path)
+        with open_encrypted(part_path, encryption_key) as source:
+            return zipfile.ZipFile(io.BytesIO(source.read()))
+    
+    @METRICS.phase('download')
+    def download_config_file(self, filename, output_dir=".", chunk_size=DOWNLOAD_CHUNK_SIZE,
+                             max_resumes=5, encryption_key=None):
+        """Download configuration file from FDM (keeps original .zip format)
+        
+        Bytes are written to <filename>.part, hashed with SHA-256 and CRC-checked
+        as they arrive, and only renamed into place once the archive verifies.
+        A dropped connection is resumed with an HTTP Range request, and a .part
+        file left by an earlier failed run is picked up where it stopped.
+        
+        With encryption_key the bytes are encrypted (fdm_backup_crypto) before
+        they reach the disk and the file is saved as <filename>.enc; the
+        SHA-256 is still that of the plain zip. Encrypted downloads resume
+        within one call, but not from a .part file left by an earlier one.
+        """
+        output_path = Path(output_dir) / filename
+        if encryption_key:
+            output_path = output_path.with_name(output_path.name + ENCRYPTED_SUFFIX)
+        part_path = output_path.with_name(output_path.name + '.part')
+        
         try:
             print(f"📥 Downloading {filename}...")
-            response = self._make_request('GET', f'action/downloadconfigfile/{filename}', 
-                                         stream=True, timeout=60)
+            sha256 = hashlib.sha256()
+            verifier = ZipStreamVerifier()
+            received = 0
+            
+            if part_path.exists() and encryption_key:
+                part_path.unlink()
+            elif part_path.exists():
+                # Re-hash what an earlier attempt already fetched, then resume after it
+                with open(part_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(chunk_size), b''):
+                        sha256.update(chunk)
+                        verifier.feed(chunk)
+                        received += len(chunk)
+                print(f"↻ Resuming from {received:,} bytes")
+            
+            resumed_from = received
+            resumes = 0
+            with open(part_path, 'ab') as f:
+                sink = StreamEncryptor(f, encryption_key) if encryption_key else f
+                while True:
+                    headers = {}
+                    if received:
+                        headers['Range'] = f'bytes={received}-'
+                    try:
+                        response = self._make_request('GET', f'action/downloadconfigfile/{filename}',
+                                                     headers=headers, stream=True, timeout=60)
+                        with response:
+                            if received and response.status_code != 206:
+                                # Server ignored the Range header, start over
+                                f.seek(0)
+                                f.truncate()
+                                if encryption_key:
+                                    sink = StreamEncryptor(f, encryption_key)
+                                sha256 = hashlib.sha256()
+                                verifier = ZipStreamVerifier()
+                                received = 0
+                            
+                            for chunk in response.iter_content(chunk_size=chunk_size):
+                                sink.write(chunk)
+                                sha256.update(chunk)
+                                verifier.feed(chunk)
+                                received += len(chunk)
+                        break
+                    except requests.exceptions.HTTPError as e:
+                        # 416: the partial file already holds the whole archive
+                        if received and e.response is not None and e.response.status_code == 416:
+                            break
+                        raise
+                    except RESUMABLE_ERRORS as e:
+                        resumes += 1
+                        if resumes > max_resumes:
+                            raise
+                        f.flush()
+                        print(f"⚠ Connection dropped at {received:,} bytes, "
+                              f"resuming ({resumes}/{max_resumes}): {e}")
+                
+                if encryption_key:
+                    sink.finish()
             
-            # Keep original filename (including .zip extension)
-            output_path = Path(output_dir) / filename
+            try:
+                verifier.finish()
+                if not verifier.supported:
+                    with self._open_zip_for_check(part_path, encryption_key) as zip_ref:
+                        bad_member = zip_ref.testzip()
+                    if bad_member:
+                        raise ValueError(f"CRC check failed for zip member {bad_member}")
+            except (ValueError, zipfile.BadZipFile):
+                # Corrupt bytes can't be resumed from, drop them
+                part_path.unlink()
+                raise
             
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            os.replace(part_path, output_path)
+            METRICS.annotate(bytes=received - resumed_from, resumes=resumes)
+            self.last_download = {
+                'path': str(output_path),
+                'sizeBytes': received,
+                'sha256': sha256.hexdigest()
+            }
             
-            print(f"✓ Downloaded: {output_path}")
-            print(f"📊 File size: {output_path.stat().st_size:,} bytes")
+            print(f"✓ Downloaded: {output_path}" + (" (encrypted)" if encryption_key else ""))
+            print(f"📊 File size: {received:,} bytes")
+            print(f"🔒 SHA-256: {self.last_download['sha256']}")
             return str(output_path)
         except Exception as e:
             print(f"✗ Download failed: {e}")
+            if part_path.exists() and encryption_key:
+                # Encrypted downloads restart from scratch, so the partial file is of no use
+                part_path.unlink()
+            elif part_path.exists():
+                print(f"ℹ Partial download kept for resume: {part_path}")
             return None
 
 
@@ -118,6 +284,7 @@ def main():
     try:
         host, username, password, download_path, filename = get_user_inputs()
         
+        METRICS.configure_from_env()
         client = FDMConfigRetriever(host)
         if not client.authenticate(username, password):
             sys.exit(1)
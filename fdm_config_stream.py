@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+"""
+FDM Config Stream
+Incremental, bounded-memory reading of exported FDM configuration archives
+"""
+import codecs
+import hashlib
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from fdm_backup_crypto import is_encrypted, open_encrypted, plain_name
+
+READ_CHUNK_SIZE = 64 * 1024
+ZIP_MEMBER_NAME = 'full_config.txt'
+
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_LOCAL_HEADER_SIG = b'PK\x03\x04'
+_DESCRIPTOR_SIG = b'PK\x07\x08'
+_CENTRAL_HEADER_SIZE = 46
+_CENTRAL_HEADER_SIG = b'PK\x01\x02'
+_ZIP64_END_SIG = b'PK\x06\x06'
+_ZIP64_LOCATOR_SIZE = 20
+_END_SIZE = 22
+_END_SIG = b'PK\x05\x06'
+# The central directory is buffered whole; anything bigger is left to zipfile
+MAX_TRAILER_SIZE = 1024 * 1024
+# Zips the stream reader can't follow are spooled for zipfile, in memory up to this size
+FALLBACK_SPOOL_SIZE = 16 * 1024 * 1024
+
+
+class _ChunkSink:
+    """Unseekable write target that collects bytes written by ZipFile"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ZipStreamVerifier:
+    """Checks zip member CRCs incrementally as archive bytes arrive
+
+    Feed the archive front to back with feed() and call finish() at the end.
+    Local headers are parsed on the fly, deflated members are inflated and
+    CRC-checked without the archive ever being complete on disk. Decompressed
+    member bytes can be observed through on_data(member_name, data). The
+    central directory is buffered and checked against the members by
+    finish(). supported turns False for layouts this can't follow.
+    """
+
+    def __init__(self, on_data=None, out_chunk_size=1024 * 1024):
+        self.on_data = on_data
+        self.out_chunk_size = out_chunk_size
+        self.members = []
+        self.supported = True
+        self._buf = bytearray()
+        self._state = 'header'
+        self._member = None
+
+    def feed(self, data):
+        """Process the next chunk of archive bytes"""
+        if not self.supported:
+            return
+        self._buf += data
+
+        while self._state != 'trailer' and self.supported:
+            if self._state == 'header' and not self._read_header():
+                break
+            if self._state == 'data' and not self._read_data():
+                break
+            if self._state == 'descriptor' and not self._read_descriptor():
+                break
+
+        if self._state == 'trailer' and len(self._buf) > MAX_TRAILER_SIZE:
+            self.supported = False
+            self._buf.clear()
+
+    def finish(self):
+        """Raise ValueError unless the whole archive was received and verified"""
+        if not self.supported:
+            return
+        if self._state != 'trailer' or not self.members:
+            raise ValueError("Zip archive is truncated")
+        self._check_trailer(bytes(self._buf))
+
+    def _read_header(self):
+        if len(self._buf) < 4:
+            return False
+        if bytes(self._buf[:4]) != _LOCAL_HEADER_SIG:
+            # The central directory follows the last member
+            self._state = 'trailer'
+            return False
+        if len(self._buf) < _LOCAL_HEADER.size:
+            return False
+
+        (_, _, flags, method, _, _, crc, csize, usize,
+         name_len, extra_len) = _LOCAL_HEADER.unpack_from(self._buf)
+        header_len = _LOCAL_HEADER.size + name_len + extra_len
+        if len(self._buf) < header_len:
+            return False
+
+        name = bytes(self._buf[_LOCAL_HEADER.size:_LOCAL_HEADER.size + name_len]).decode('utf-8', 'replace')
+        extra = bytes(self._buf[_LOCAL_HEADER.size + name_len:header_len])
+        zip64 = False
+        while len(extra) >= 4:
+            tag, size = struct.unpack_from('<2H', extra)
+            if tag == 0x0001 and size >= 16:
+                usize, csize = struct.unpack_from('<2Q', extra, 4)
+                zip64 = True
+            extra = extra[4 + size:]
+        del self._buf[:header_len]
+
+        has_descriptor = bool(flags & 0x08)
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) or \
+                (method == zipfile.ZIP_STORED and has_descriptor) or flags & 0x01:
+            # Encrypted, unusual codec or unsized stored data: leave it to zipfile
+            self.supported = False
+            return False
+
+        self._member = {
+            'name': name, 'method': method, 'crc': crc, 'csize': csize, 'usize': usize,
+            'has_descriptor': has_descriptor, 'zip64': zip64, 'remaining': csize,
+            'actual_crc': 0, 'actual_size': 0,
+            'inflater': zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None
+        }
+        self._state = 'data'
+        return True
+
+    def _emit(self, data):
+        member = self._member
+        member['actual_crc'] = zlib.crc32(data, member['actual_crc'])
+        member['actual_size'] += len(data)
+        if self.on_data and data:
+            self.on_data(member['name'], data)
+
+    def _read_data(self):
+        member = self._member
+
+        if member['inflater'] is None:
+            data = bytes(self._buf[:member['remaining']])
+            del self._buf[:len(data)]
+            member['remaining'] -= len(data)
+            self._emit(data)
+            if member['remaining']:
+                return False
+        else:
+            inflater = member['inflater']
+            data = bytes(self._buf)
+            self._buf.clear()
+            while data and not inflater.eof:
+                try:
+                    self._emit(inflater.decompress(data, self.out_chunk_size))
+                except zlib.error as e:
+                    raise ValueError(f"Corrupt data in zip member {member['name']}: {e}")
+                data = inflater.unconsumed_tail
+            if not inflater.eof:
+                return False
+            self._buf[:0] = inflater.unused_data
+
+        self._state = 'descriptor' if member['has_descriptor'] else 'check'
+        if self._state == 'check':
+            self._check_member(member['crc'], member['usize'])
+        return True
+
+    def _read_descriptor(self):
+        member = self._member
+        size_len = 8 if member['zip64'] else 4
+        needed = 4 + 2 * size_len
+        if len(self._buf) < 4 + needed:
+            # Make sure a (possibly signed) descriptor is fully buffered
+            if len(self._buf) < needed or bytes(self._buf[:4]) == _DESCRIPTOR_SIG:
+                return False
+
+        offset = 4 if bytes(self._buf[:4]) == _DESCRIPTOR_SIG else 0
+        crc = struct.unpack_from('<L', self._buf, offset)[0]
+        usize = struct.unpack_from('<Q' if member['zip64'] else '<L', self._buf,
+                                   offset + 4 + size_len)[0]
+        del self._buf[:offset + needed]
+        self._check_member(crc, usize)
+        return True
+
+    def _check_member(self, crc, usize):
+        member = self._member
+        if member['actual_crc'] != crc or member['actual_size'] != usize:
+            raise ValueError(f"CRC check failed for zip member {member['name']}")
+        self.members.append(member['name'])
+        self._member = None
+        self._state = 'header'
+
+    def _check_trailer(self, data):
+        """Check the central directory and end record that follow the members"""
+        names = []
+        offset = 0
+        while data[offset:offset + 4] == _CENTRAL_HEADER_SIG:
+            if len(data) < offset + _CENTRAL_HEADER_SIZE:
+                raise ValueError("Zip archive is truncated")
+            name_len, extra_len, comment_len = struct.unpack_from('<3H', data, offset + 28)
+            end = offset + _CENTRAL_HEADER_SIZE + name_len + extra_len + comment_len
+            if len(data) < end:
+                raise ValueError("Zip archive is truncated")
+            names.append(data[offset + _CENTRAL_HEADER_SIZE:
+                              offset + _CENTRAL_HEADER_SIZE + name_len].decode('utf-8', 'replace'))
+            offset = end
+
+        entries = None
+        if data[offset:offset + 4] == _ZIP64_END_SIG:
+            if len(data) < offset + 40:
+                raise ValueError("Zip archive is truncated")
+            record_size, = struct.unpack_from('<Q', data, offset + 4)
+            entries, = struct.unpack_from('<Q', data, offset + 32)
+            offset += 12 + record_size + _ZIP64_LOCATOR_SIZE
+
+        if len(data) < offset + 4:
+            raise ValueError("Zip archive is truncated")
+        if data[offset:offset + 4] != _END_SIG:
+            # Something other than a plain central directory, leave it to zipfile
+            self.supported = False
+            return
+        if len(data) < offset + _END_SIZE:
+            raise ValueError("Zip archive is truncated")
+        end_entries, = struct.unpack_from('<H', data, offset + 10)
+        comment_len, = struct.unpack_from('<H', data, offset + 20)
+        if len(data) < offset + _END_SIZE + comment_len:
+            raise ValueError("Zip archive is truncated")
+
+        if entries is None:
+            entries = end_entries
+        if entries != len(names) or names != self.members:
+            raise ValueError("Zip central directory does not match the archive's members")
+
+
+class StreamedZipMember:
+    """Readable stream of the first member of a zip arriving as an unseekable stream
+
+    The archive is read through ZipStreamVerifier, so the member is inflated
+    and CRC-checked on the way without the zip ever being on disk. Reading
+    to the end also checks the rest of the archive.
+
+    For layouts the verifier can't follow, reopen() is called for a fresh
+    copy of the archive, which is spooled (to an anonymous temporary file
+    past FALLBACK_SPOOL_SIZE) and read with zipfile from where the stream
+    left off. Without reopen such archives raise ValueError.
+    """
+
+    def __init__(self, source, chunk_size=READ_CHUNK_SIZE, reopen=None):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.reopen = reopen
+        self._buf = bytearray()
+        self._member = None
+        self._eof = False
+        self._returned = 0
+        self._fallback = None
+        self._spool = None
+        self._verifier = ZipStreamVerifier(on_data=self._on_data)
+
+    def _on_data(self, name, data):
+        if self._member is None:
+            self._member = name
+        if name == self._member:
+            self._buf += data
+
+    def _open_fallback(self):
+        if self.reopen is None:
+            raise ValueError("Zip layout can't be read as a stream")
+        self._spool = tempfile.SpooledTemporaryFile(max_size=FALLBACK_SPOOL_SIZE)
+        with self.reopen() as source:
+            shutil.copyfileobj(source, self._spool, self.chunk_size)
+        self._spool.seek(0)
+
+        zip_ref = zipfile.ZipFile(self._spool)
+        member = self._member if self._member in zip_ref.namelist() else find_config_member(zip_ref)
+        self._fallback = zip_ref.open(member)
+        # Skip what the stream already handed out; anything buffered is read again
+        for _ in range(self._returned // self.chunk_size):
+            self._fallback.read(self.chunk_size)
+        self._fallback.read(self._returned % self.chunk_size)
+        self._buf.clear()
+
+    def read(self, size=-1):
+        if self._fallback is not None:
+            return self._fallback.read(size)
+        while not self._eof and (size < 0 or len(self._buf) < size):
+            data = self.source.read(self.chunk_size)
+            if data:
+                self._verifier.feed(data)
+            else:
+                self._verifier.finish()
+                self._eof = True
+            if not self._verifier.supported:
+                self._open_fallback()
+                return self._fallback.read(size)
+        if size < 0 or size > len(self._buf):
+            size = len(self._buf)
+        data = bytes(self._buf[:size])
+        del self._buf[:size]
+        self._returned += size
+        return data
+
+    def close(self):
+        """Release the zipfile fallback, if one was opened"""
+        if self._fallback is not None:
+            self._fallback.close()
+        if self._spool is not None:
+            self._spool.close()
+
+
+def find_config_member(zip_ref):
+    """Find the JSON config member in an export archive"""
+    file_list = zip_ref.namelist()
+    if not file_list:
+        raise ValueError("Archive is empty")
+
+    # Usually the only file, named *.json or without an extension
+    for fname in file_list:
+        if fname.endswith('.json') or fname == 'config' or not '.' in fname:
+            return fname
+
+    return file_list[0]  # Use first file if no obvious config found
+
+
+@contextmanager
+def open_config_stream(file_path):
+    """Open the raw JSON config bytes of a .zip, .zst or .xz archive or plain .json/.txt file
+
+    Encrypted backups (<name>.enc) are decrypted and, for zips, unpacked on
+    the fly; no plaintext is written to disk unless the zip has a layout
+    only zipfile can read (see StreamedZipMember).
+    """
+    file_path = Path(file_path)
+    suffix = file_path.suffix.lower()
+
+    if is_encrypted(file_path):
+        with open_encrypted(file_path) as plain:
+            if plain_name(file_path).suffix.lower() != '.zip':
+                yield plain
+                return
+            member = StreamedZipMember(plain, reopen=lambda: open_encrypted(file_path))
+            try:
+                yield member
+            finally:
+                member.close()
+    elif suffix in ('.zst', '.xz'):
+        # Imported here because fdm_archive_codec itself builds on this module
+        from fdm_archive_codec import open_repacked
+        with open_repacked(file_path) as stream:
+            yield stream
+    elif suffix == '.zip':
+        with zipfile.ZipFile(file_path, 'r') as zip_ref:
+            with zip_ref.open(find_config_member(zip_ref)) as stream:
+                yield stream
+    else:
+        with open(file_path, 'rb') as stream:
+            yield stream
+
+
+def iter_zipped_config(source, member_name=ZIP_MEMBER_NAME, chunk_size=READ_CHUNK_SIZE):
+    """Yield a deflated zip archive of source's bytes while it is being compressed
+
+    Nothing touches the disk: each chunk read from source is compressed and
+    the resulting zip bytes are yielded straight away.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        with zip_ref.open(member_name, 'w') as dest:
+            for data in iter(lambda: source.read(chunk_size), b''):
+                dest.write(data)
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+    # Closing the archive writes the data descriptor and central directory
+    yield sink.drain()
+
+
+def canonical_json(obj):
+    """Serialize an object to canonical JSON bytes (sorted keys, no whitespace)"""
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def object_digest(obj):
+    """SHA-256 hex digest of an object's canonical JSON form"""
+    return hashlib.sha256(canonical_json(obj)).hexdigest()
+
+
+def _write_json_array(dest, objects):
+    """Write objects (dicts or pre-serialized JSON bytes) to dest as a JSON array"""
+    dest.write(b'[')
+    for index, obj in enumerate(objects):
+        if index:
+            dest.write(b',\n')
+        dest.write(obj if isinstance(obj, bytes) else json.dumps(obj).encode('utf-8'))
+        yield
+    dest.write(b']')
+
+
+def iter_config_archive(objects, member_name=ZIP_MEMBER_NAME):
+    """Yield an import zip built from a stream of config objects, chunk by chunk"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        with zip_ref.open(member_name, 'w') as dest:
+            for _ in _write_json_array(dest, objects):
+                if sink.chunks:
+                    yield sink.drain()
+    yield sink.drain()
+
+
+def write_config_archive(objects, output_path, member_name=ZIP_MEMBER_NAME):
+    """Write a stream of config objects into an import zip, atomically
+
+    Returns the number of objects written.
+    """
+    output_path = Path(output_path)
+    part_path = output_path.with_name(output_path.name + '.part')
+    count = 0
+
+    try:
+        with zipfile.ZipFile(part_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+            with zip_ref.open(member_name, 'w') as dest:
+                for _ in _write_json_array(dest, objects):
+                    count += 1
+        os.replace(part_path, output_path)
+    finally:
+        if part_path.exists():
+            part_path.unlink()
+
+    return count
+
+
+def iter_config_objects(stream, chunk_size=READ_CHUNK_SIZE):
+    """Yield the objects of a top-level JSON array one at a time
+
+    Only the current object and one read chunk are held in memory, so the
+    array can be arbitrarily large. Raises json.JSONDecodeError on malformed
+    input and ValueError if the document is not an array.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    state = {'buf': '', 'pos': 0, 'eof': False}
+
+    def fill(size):
+        data = stream.read(size)
+        if not data:
+            state['eof'] = True
+        # Drop the consumed prefix so the buffer only holds unparsed text
+        state['buf'] = state['buf'][state['pos']:] + text_decoder.decode(data, final=not data)
+        state['pos'] = 0
+
+    def next_char():
+        while True:
+            buf, pos = state['buf'], state['pos']
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            state['pos'] = pos
+            if pos < len(buf):
+                return buf[pos]
+            if state['eof']:
+                return ''
+            fill(chunk_size)
+
+    def error(message):
+        return json.JSONDecodeError(message, state['buf'], state['pos'])
+
+    if next_char() != '[':
+        raise ValueError("Configuration must be a JSON array")
+    state['pos'] += 1
+
+    if next_char() == ']':
+        return
+
+    while True:
+        next_char()
+        read_size = chunk_size
+        while True:
+            try:
+                obj, end = decoder.raw_decode(state['buf'], state['pos'])
+                # A value touching the end of the buffer may continue in the next chunk
+                if end < len(state['buf']) or state['eof']:
+                    break
+            except json.JSONDecodeError:
+                if state['eof']:
+                    raise
+            fill(read_size)
+            read_size *= 2
+
+        state['pos'] = end
+        yield obj
+
+        separator = next_char()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise error("Expecting ',' delimiter" if separator else "Unterminated array")
+        state['pos'] += 1
+
+
+def read_config_metadata(file_path):
+    """Return the metadata object at the start of a config without reading the rest"""
+    with open_config_stream(file_path) as stream:
+        for obj in iter_config_objects(stream):
+            if isinstance(obj, dict) and obj.get('type') == 'metadata':
+                return obj
+            break
+    raise ValueError("First object must be metadata")
+
+
+def summarize_config(file_path):
+    """Stream a config file and return its metadata, object count and per-type tally
+
+    Raises ValueError if the file is not a non-empty array that starts with a
+    metadata object.
+    """
+    metadata = None
+    types = Counter()
+
+    with open_config_stream(file_path) as stream:
+        for obj in iter_config_objects(stream):
+            if metadata is None:
+                if not isinstance(obj, dict) or obj.get('type') != 'metadata':
+                    raise ValueError("First object must be metadata")
+                metadata = obj
+            types[obj.get('type', 'unknown') if isinstance(obj, dict) else 'invalid'] += 1
+        # Read to the end so the zip CRC (or zstd/xz checksum) is checked as well
+        for _ in iter(lambda: stream.read(READ_CHUNK_SIZE), b''):
+            pass
+
+    if metadata is None:
+        raise ValueError("Configuration must be a non-empty JSON array")
+
+    return {
+        'metadata': metadata,
+        'objectCount': sum(types.values()),
+        'types': dict(types)
+    }
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+FDM Config Transform
+Rule-driven rewriting of exported configs (IPs, hostnames, interface and object names)
+"""
+import argparse
+import json
+import re
+import sys
+from fdm_config_stream import iter_config_objects, open_config_stream, write_config_archive
+
+# Path that applies an action to every string value anywhere in the object
+ANY_FIELD = '*'
+
+
+def get_path(obj, path):
+    """Value at a dotted path ('ipv4.ipAddress.ipAddress', list indexes allowed); None if absent"""
+    for part in path.split('.'):
+        if isinstance(obj, dict):
+            obj = obj.get(part)
+        elif isinstance(obj, list) and part.isdigit() and int(part) < len(obj):
+            obj = obj[int(part)]
+        else:
+            return None
+    return obj
+
+
+def set_path(obj, path, value):
+    """Set the value at a dotted path, creating intermediate dicts"""
+    parts = path.split('.')
+    for part in parts[:-1]:
+        obj = obj[int(part)] if isinstance(obj, list) else obj.setdefault(part, {})
+    if isinstance(obj, list):
+        obj[int(parts[-1])] = value
+    else:
+        obj[parts[-1]] = value
+
+
+def map_strings(value, func):
+    """Apply func to every string inside value (dict keys excluded); returns the new value"""
+    if isinstance(value, str):
+        return func(value)
+    if isinstance(value, dict):
+        return {key: map_strings(item, func) for key, item in value.items()}
+    if isinstance(value, list):
+        return [map_strings(item, func) for item in value]
+    return value
+
+
+class TransformRule:
+    """One match/rewrite rule from a rules file
+
+    match maps dotted paths to expected values; string values are regular
+    expressions that must match the whole field, so 'networkobject' does not
+    match 'networkobjectgroup' (use 'networkobject.*' for a prefix). Actions, applied in this order:
+    set {path: value}, replace {path: {old: new}} (exact values), sub
+    {path: [pattern, replacement]} (regex), and drop. A path of '*' in
+    replace/sub means every string in the object, which also catches
+    references to renamed objects.
+    """
+
+    def __init__(self, spec, index=0):
+        self.name = spec.get('name') or f'rule-{index + 1}'
+        self.match = [(path, re.compile(expected) if isinstance(expected, str) else expected)
+                      for path, expected in spec.get('match', {}).items()]
+        self.set = spec.get('set', {})
+        self.replace = spec.get('replace', {})
+        self.sub = {path: (re.compile(pattern), replacement)
+                    for path, (pattern, replacement) in spec.get('sub', {}).items()}
+        self.drop = bool(spec.get('drop'))
+        if not (self.set or self.replace or self.sub or self.drop):
+            raise ValueError(f"Rule {self.name} has no action (set, replace, sub or drop)")
+        self.matched = 0
+        self.changed = 0
+
+    def matches(self, obj):
+        for path, expected in self.match:
+            value = get_path(obj, path)
+            if isinstance(expected, re.Pattern):
+                if not isinstance(value, str) or not expected.fullmatch(value):
+                    return False
+            elif value != expected:
+                return False
+        return True
+
+    def _rewrite(self, obj, path, func):
+        if path == ANY_FIELD:
+            return map_strings(obj, func)
+        value = get_path(obj, path)
+        if value is not None:
+            set_path(obj, path, map_strings(value, func))
+        return obj
+
+    def apply(self, objects):
+        """Generator stage: rewrite (or drop) matching objects, pass the rest through"""
+        for obj in objects:
+            if not isinstance(obj, dict) or not self.matches(obj):
+                yield obj
+                continue
+
+            self.matched += 1
+            if self.drop:
+                self.changed += 1
+                continue
+
+            changed = False
+
+            def track(func):
+                def rewrite(value):
+                    nonlocal changed
+                    result = func(value)
+                    changed = changed or result != value
+                    return result
+                return rewrite
+
+            for path, value in self.set.items():
+                changed = changed or get_path(obj, path) != value
+                set_path(obj, path, value)
+            for path, mapping in self.replace.items():
+                obj = self._rewrite(obj, path, track(lambda s, mapping=mapping: mapping.get(s, s)))
+            for path, (pattern, replacement) in self.sub.items():
+                obj = self._rewrite(obj, path, track(lambda s, p=pattern, r=replacement: p.sub(r, s)))
+            if changed:
+                self.changed += 1
+            yield obj
+
+    def stats(self):
+        return {'rule': self.name, 'matched': self.matched, 'changed': self.changed}
+
+
+def load_rules(rules_path):
+    """Load transform rules from a JSON file ({"rules": [...]} or a bare list)"""
+    with open(rules_path, 'r') as f:
+        specs = json.load(f)
+    if isinstance(specs, dict):
+        specs = specs.get('rules', [])
+    return [TransformRule(spec, index) for index, spec in enumerate(specs)]
+
+
+def transform_objects(objects, rules):
+    """Chain the rules into one generator pipeline over a stream of objects"""
+    for rule in rules:
+        objects = rule.apply(objects)
+    return objects
+
+
+def transform_config(input_path, rules, output_path):
+    """Stream a config through the rules into a new import zip
+
+    Each object is parsed once and passed through every rule before it is
+    written, so memory stays bounded by the largest single object. Returns
+    the number of objects written.
+    """
+    with open_config_stream(input_path) as stream:
+        return write_config_archive(transform_objects(iter_config_objects(stream), rules), output_path)
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Rewrite an FDM export with match/rewrite rules")
+    parser.add_argument('input', help="Export to transform (.zip, .json/.txt, .zst/.xz)")
+    parser.add_argument('rules', help="Rules file (.json)")
+    parser.add_argument('-o', '--output', required=True, help="Output import .zip")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+        rules = load_rules(args.rules)
+        print(f"🔧 Transforming {args.input} with {len(rules)} rule(s)...")
+
+        count = transform_config(args.input, rules, args.output)
+
+        print(f"✓ Wrote {args.output}: {count} objects")
+        print("\n📊 Rule hits:")
+        for rule in rules:
+            stats = rule.stats()
+            print(f"  • {stats['rule']}: {stats['matched']} matched, {stats['changed']} changed")
+
+    except KeyboardInterrupt:
+        print("\n\n⚠ Operation cancelled by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
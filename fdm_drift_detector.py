@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+FDM Drift Detector
+Compares the latest backup of every device with a golden configuration, in parallel
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from fdm_config_index import iter_archives
+from fdm_config_stream import iter_config_objects, object_digest, open_config_stream
+
+# Fields of an object (and of references to it) that differ between devices
+VOLATILE_FIELDS = frozenset(('id', 'version', 'links'))
+
+# Set in each worker process by _init_worker
+_golden = None
+_ignore_types = frozenset()
+_ignore_fields = frozenset()
+_detail = False
+
+
+def _is_reference(value):
+    return isinstance(value.get('id'), str) and 'type' in value
+
+
+def normalize(value, ignore_fields=frozenset(), top=True):
+    """Copy of an object without its volatile fields and the ignored fields
+
+    VOLATILE_FIELDS are dropped from the object itself and from the
+    references it holds, so references compare by type and name across
+    devices where the referenced ids differ; other nested fields named like
+    them (a protocol version, say) are kept. ignore_fields go at any depth.
+    """
+    if isinstance(value, dict):
+        volatile = VOLATILE_FIELDS if top or _is_reference(value) else ()
+        return {key: normalize(item, ignore_fields, False) for key, item in value.items()
+                if key not in ignore_fields and key not in volatile}
+    if isinstance(value, list):
+        return [normalize(item, ignore_fields, False) for item in value]
+    return value
+
+
+def iter_normalized(file_path, ignore_types=frozenset(), ignore_fields=frozenset()):
+    """Yield (key, digest, normalized object) for every config object of an archive
+
+    The key is 'type/name'; nameless objects are keyed by their digest, so
+    they can only match an identical object.
+    """
+    skipped = {'metadata', *ignore_types}
+    with open_config_stream(file_path) as stream:
+        for obj in iter_config_objects(stream):
+            if not isinstance(obj, dict) or obj.get('type') in skipped:
+                continue
+            body = normalize(obj, ignore_fields)
+            digest = object_digest(body)
+            yield f"{obj.get('type')}/{obj.get('name') or '#' + digest[:16]}", digest, body
+
+
+def build_golden(file_path, ignore_types=(), ignore_fields=()):
+    """Golden set of a template config: settings plus {key: {'digest', 'object'}}
+
+    Objects sharing a type and name keep the first one; their keys are
+    listed under 'duplicates'.
+    """
+    objects = {}
+    duplicates = set()
+    for key, digest, body in iter_normalized(file_path, set(ignore_types), frozenset(ignore_fields)):
+        if key in objects:
+            duplicates.add(key)
+            continue
+        objects[key] = {'digest': digest, 'object': body}
+    return {'createdAt': time.time(), 'source': str(file_path),
+            'ignoreTypes': sorted(ignore_types), 'ignoreFields': sorted(ignore_fields),
+            'duplicates': sorted(duplicates), 'objects': objects}
+
+
+def save_golden(golden, output_path):
+    with open(output_path, 'w') as f:
+        json.dump(golden, f)
+
+
+def load_golden(golden_path):
+    with open(golden_path, 'r') as f:
+        return json.load(f)
+
+
+def changed_fields(expected, actual):
+    """Top-level fields whose normalized values differ between two objects"""
+    return sorted(key for key in expected.keys() | actual.keys() if expected.get(key) != actual.get(key))
+
+
+def _init_worker(golden, detail):
+    global _golden, _ignore_types, _ignore_fields, _detail
+    _golden = golden
+    _ignore_types = frozenset(golden.get('ignoreTypes', ()))
+    _ignore_fields = frozenset(golden.get('ignoreFields', ()))
+    _detail = detail
+
+
+def scan_archive(path):
+    """Compare one archive with the worker's golden set; returns a drift summary dict"""
+    result = {'device': Path(path).parent.name, 'path': str(path), 'objects': 0, 'matched': 0,
+              'changed': 0, 'missing': 0, 'extra': 0, 'error': None}
+    golden = _golden['objects']
+    seen = set()
+    changed, extra = [], []
+
+    try:
+        for key, digest, body in iter_normalized(path, _ignore_types, _ignore_fields):
+            result['objects'] += 1
+            expected = golden.get(key)
+            if expected is None:
+                extra.append(key)
+                continue
+            seen.add(key)
+            if expected['digest'] == digest:
+                result['matched'] += 1
+            elif _detail:
+                changed.append({'object': key, 'fields': changed_fields(expected['object'], body)})
+            else:
+                changed.append(key)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
+
+    missing = sorted(golden.keys() - seen)
+    result.update(changed=len(changed), missing=len(missing), extra=len(extra))
+    if _detail:
+        result['detail'] = {'changed': changed, 'missing': missing, 'extra': sorted(extra)}
+    return result
+
+
+def latest_archives(paths):
+    """The newest archive per device directory (files given explicitly are always kept)"""
+    latest = {}
+    explicit = []
+    for path in map(Path, paths):
+        if not path.is_dir():
+            explicit.append(path)
+            continue
+        for archive in iter_archives([path]):
+            device = archive.parent
+            if device not in latest or archive.stat().st_mtime > latest[device].stat().st_mtime:
+                latest[device] = archive
+    return explicit + sorted(latest.values())
+
+
+def detect_drift(golden, archives, workers=None, detail=False):
+    """Scan archives across a process pool; yields one drift summary per archive"""
+    if not detail:
+        # Workers only need the digests unless they have to explain differences
+        golden = dict(golden, objects={key: {'digest': entry['digest']}
+                                       for key, entry in golden['objects'].items()})
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(golden, detail)) as pool:
+        yield from pool.map(scan_archive, [str(path) for path in archives])
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Detect configuration drift from a golden template")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    golden = commands.add_parser('golden', help="Precompute the golden set of a template config")
+    golden.add_argument('template', help="Template export (.zip, .json/.txt, .zst/.xz, .enc)")
+    golden.add_argument('-o', '--output', default='fdm_golden.json', help="Golden set file")
+    golden.add_argument('--ignore-type', action='append', default=[],
+                        help="Object type that is expected to differ per device (repeatable)")
+    golden.add_argument('--ignore-field', action='append', default=[],
+                        help="Field to ignore at any depth (repeatable); id/version/links of "
+                        "objects and references are always ignored")
+
+    check = commands.add_parser('check', help="Compare backups with a golden set")
+    check.add_argument('golden', help="Golden set file")
+    check.add_argument('paths', nargs='+', help="Backups, or directories holding <host>/ backups "
+                       "(the newest archive per device is used)")
+    check.add_argument('-w', '--workers', type=int, help="Parallel processes [CPU count]")
+    check.add_argument('--detail', action='store_true', help="List drifted objects and fields")
+    check.add_argument('--report', help="Write every summary to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+
+        if args.command == 'golden':
+            golden = build_golden(args.template, args.ignore_type, args.ignore_field)
+            save_golden(golden, args.output)
+            if golden['duplicates']:
+                print(f"⚠ {len(golden['duplicates'])} type/name key(s) appear more than once in the "
+                      f"template; only the first of each is compared:")
+                for key in golden['duplicates']:
+                    print(f"    • {key}")
+            print(f"✓ Golden set of {len(golden['objects'])} objects written to {args.output}")
+            return
+
+        golden = load_golden(args.golden)
+        archives = latest_archives(args.paths)
+        started = time.time()
+        print(f"🔍 Checking {len(archives)} device(s) against {golden['source']}...")
+
+        results = []
+        for result in detect_drift(golden, archives, args.workers, args.detail):
+            results.append(result)
+            if result['error']:
+                print(f"✗ {result['device']}: {result['error']}")
+            elif result['changed'] or result['missing'] or result['extra']:
+                print(f"⚠ {result['device']}: {result['changed']} changed, {result['missing']} missing, "
+                      f"{result['extra']} extra")
+                for entry in result.get('detail', {}).get('changed', []):
+                    print(f"    ~ {entry['object']} ({', '.join(entry['fields'])})")
+                for label, symbol in (('missing', '-'), ('extra', '+')):
+                    for key in result.get('detail', {}).get(label, []):
+                        print(f"    {symbol} {key}")
+            else:
+                print(f"✓ {result['device']}: in sync ({result['objects']} objects)")
+
+        drifted = sum(1 for r in results if r['changed'] or r['missing'] or r['extra'])
+        failed = sum(1 for r in results if r['error'])
+        objects = sum(r['objects'] for r in results)
+        print(f"\n📊 {len(results)} device(s): {drifted} drifted, {failed} unreadable, "
+              f"{objects:,} objects in {time.time() - started:.1f}s")
+
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump({'checkedAt': time.time(), 'golden': golden['source'], 'devices': results},
+                          f, indent=2)
+            print(f"✓ Report written to {args.report}")
+
+        if drifted or failed:
+            sys.exit(1)
+
+    except KeyboardInterrupt:
+        print("\n\n⚠ Operation cancelled by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
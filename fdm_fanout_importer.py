@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+FDM Fan-out Importer
+Pushes one golden configuration to many FDM devices concurrently
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from fdm_backup_crypto import is_encrypted, open_encrypted, plain_name
+from fdm_config_importer import FDMConfigImporter
+from fdm_config_stream import iter_zipped_config, open_config_stream, summarize_config
+from fdm_fleet_exporter import load_inventory
+from fdm_job_tracker import FDMJobTracker
+from fdm_metrics import METRICS
+from fdm_token_cache import DEFAULT_CACHE_DIR, FDMTokenCache
+
+
+def package_config(file_path):
+    """Validate a config once and build the zip payload every device receives
+
+    Returns (upload_name, payload bytes, summary). A .zip is sent as it is;
+    .txt/.json and repacked .zst/.xz backups are zipped in memory, and
+    encrypted .enc backups are decrypted in memory.
+    """
+    file_path = Path(file_path)
+    summary = summarize_config(file_path)
+    name = plain_name(file_path)
+
+    if name.suffix.lower() == '.zip':
+        upload_name = name.name
+        if is_encrypted(file_path):
+            with open_encrypted(file_path) as source:
+                payload = source.read()
+        else:
+            payload = file_path.read_bytes()
+    else:
+        upload_name = f"{name.stem}.zip"
+        with open_config_stream(file_path) as source:
+            payload = b''.join(iter_zipped_config(source))
+    return upload_name, payload, summary
+
+
+class _BudgetExhausted(Exception):
+    """Raised between stages to stop a device once the failure budget is used up"""
+
+
+class FDMFanoutImporter:
+    """Runs upload -> import -> wait on many devices with one shared payload
+
+    Once max_failures devices have failed, devices stop before their next
+    upload or import and are reported as skipped; imports already started
+    are allowed to finish. A device that fails or stops after the upload
+    has the uploaded file removed again. Given the config's metadata, each
+    device is checked before the upload and refused if the import would
+    fail there.
+    """
+
+    def __init__(self, upload_name, payload, max_workers=8, max_failures=1, import_timeout=600,
+                 auto_deploy=False, allow_pending_changes=False, token_cache=None, metadata=None):
+        self.upload_name = upload_name
+        self.payload = payload
+        self.max_workers = max_workers
+        self.max_failures = max_failures
+        self.import_timeout = import_timeout
+        self.auto_deploy = auto_deploy
+        self.allow_pending_changes = allow_pending_changes
+        self.token_cache = token_cache
+        self.metadata = metadata
+        self.failures = 0
+        self._lock = threading.Lock()
+        # One poll loop watches the import jobs of every device
+        self.job_tracker = FDMJobTracker()
+
+    def halted(self):
+        """Check whether the failure budget is used up"""
+        with self._lock:
+            return self.max_failures is not None and self.failures >= self.max_failures
+
+    def _check_budget(self):
+        if self.halted():
+            raise _BudgetExhausted("Failure budget exhausted")
+
+    def import_device(self, device):
+        """Run upload -> import -> wait for a single device and return its result"""
+        host = device['host']
+        result = {'host': host, 'status': 'FAILED', 'stage': None, 'jobId': None, 'error': None}
+        started = time.time()
+        client = disk_filename = None
+
+        if self.halted():
+            result.update(status='SKIPPED', error="Failure budget exhausted")
+            return result
+
+        try:
+            result['stage'] = 'authenticate'
+            client = FDMConfigImporter(host, job_tracker=self.job_tracker, token_cache=self.token_cache)
+            if not device.get('password') and not self.token_cache:
+                raise ValueError("No password configured")
+            if not client.authenticate(device['username'], device['password']):
+                raise RuntimeError("Authentication failed")
+
+            if self.metadata is not None:
+                result['stage'] = 'preflight'
+                problems = client.preflight_problems(self.metadata, self.allow_pending_changes)
+                if problems:
+                    raise RuntimeError('; '.join(problems))
+
+            self._check_budget()
+            result['stage'] = 'upload'
+            disk_filename = client.upload_config_stream(self.upload_name, self.payload)['diskFileName']
+
+            self._check_budget()
+            result['stage'] = 'import'
+            job_id = client.import_configuration(disk_filename, auto_deploy=self.auto_deploy,
+                                                 allow_pending_changes=self.allow_pending_changes)
+            if not job_id:
+                raise RuntimeError("Import job creation failed")
+            result['jobId'] = job_id
+
+            result['stage'] = 'wait'
+            status_data = client.wait_for_import_completion(job_id, timeout=self.import_timeout)
+            if not status_data:
+                raise RuntimeError("Import job failed or timed out")
+
+            result.update(status='SUCCESS', stage='done')
+        except _BudgetExhausted as e:
+            result.update(status='SKIPPED', error=str(e))
+        except Exception as e:
+            result['error'] = str(e)
+            with self._lock:
+                self.failures += 1
+            print(f"✗ [{host}] {result['stage']} failed: {e}")
+
+        if disk_filename and result['status'] != 'SUCCESS':
+            # Don't leave a config that was never (successfully) imported on the device
+            client.delete_config_file(disk_filename)
+
+        result['durationSeconds'] = round(time.time() - started, 2)
+        METRICS.observe('device_import', time.time() - started, host=host,
+                        outcome='ok' if result['status'] == 'SUCCESS' else 'failed')
+        METRICS.log('device_import', **result)
+        return result
+
+    def run(self, devices):
+        """Import to all devices through a bounded worker pool"""
+        results = []
+        print(f"🚀 Importing {self.upload_name} ({len(self.payload):,} bytes) to {len(devices)} "
+              f"device(s) with {self.max_workers} worker(s)...")
+
+        self.job_tracker.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = [pool.submit(self.import_device, device) for device in devices]
+                for future in as_completed(futures):
+                    result = future.result()
+                    results.append(result)
+                    if result['status'] == 'SUCCESS':
+                        print(f"✓ [{result['host']}] imported ({result['durationSeconds']}s)")
+        finally:
+            self.job_tracker.stop()
+
+        if self.halted():
+            print(f"⚠ Rollout halted after {self.failures} failure(s)")
+        return sorted(results, key=lambda r: r['host'])
+
+
+def write_summary(results, summary_path, source):
+    """Write the per-device rollout summary as JSON"""
+    summary = {
+        'generatedAt': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'source': str(source),
+        'total': len(results),
+        'succeeded': sum(1 for r in results if r['status'] == 'SUCCESS'),
+        'failed': sum(1 for r in results if r['status'] == 'FAILED'),
+        'skipped': sum(1 for r in results if r['status'] == 'SKIPPED'),
+        'devices': results
+    }
+
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Import one FDM configuration to many devices")
+    parser.add_argument('config', help="Golden config (.zip, .json/.txt, repacked .zst/.xz or encrypted .enc)")
+    parser.add_argument('inventory', help="Inventory file (.json or .csv) with host/username columns")
+    parser.add_argument('-w', '--workers', type=int, default=8,
+                        help="Maximum devices imported concurrently (default: 8)")
+    parser.add_argument('--max-failures', type=int, default=1,
+                        help="Stop starting new devices after this many failures (default: 1, 0 = never)")
+    parser.add_argument('--timeout', type=int, default=600,
+                        help="Import job timeout per device in seconds (default: 600)")
+    parser.add_argument('--auto-deploy', action='store_true', help="Deploy automatically after import")
+    parser.add_argument('--allow-pending-changes', action='store_true',
+                        help="Import even if devices have pending changes")
+    parser.add_argument('--password-env', default='FDM_PASSWORD',
+                        help="Environment variable holding the default password")
+    parser.add_argument('--summary', default='fanout_summary.json', help="Summary file path")
+    parser.add_argument('--token-cache', nargs='?', const=str(DEFAULT_CACHE_DIR),
+                        help="Reuse encrypted cached tokens between runs [~/.fdm_config_manager/tokens]")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+        METRICS.configure_from_env()
+        devices = load_inventory(args.inventory, default_password=os.environ.get(args.password_env))
+        if not devices:
+            print("✗ Inventory contains no devices")
+            sys.exit(1)
+
+        print(f"🔍 Validating configuration file: {args.config}")
+        upload_name, payload, config_summary = package_config(args.config)
+        metadata = config_summary['metadata']
+        print(f"✓ Valid configuration: {metadata.get('hardwareModel', 'Unknown')} "
+              f"{metadata.get('softwareVersion', 'Unknown')}, {config_summary['objectCount']} objects")
+
+        token_cache = FDMTokenCache(args.token_cache) if args.token_cache else None
+        importer = FDMFanoutImporter(upload_name, payload, max_workers=args.workers,
+                                     max_failures=args.max_failures or None,
+                                     import_timeout=args.timeout,
+                                     auto_deploy=args.auto_deploy,
+                                     allow_pending_changes=args.allow_pending_changes,
+                                     token_cache=token_cache, metadata=metadata)
+        results = importer.run(devices)
+        summary = write_summary(results, args.summary, args.config)
+
+        print(f"\n📊 Rollout finished: {summary['succeeded']} succeeded, {summary['failed']} failed, "
+              f"{summary['skipped']} skipped")
+        for result in results:
+            if result['status'] != 'SUCCESS':
+                print(f"  • {result['host']}: {result['status']} ({result['error']})")
+        print(f"✓ Summary written to: {args.summary}")
+
+        if summary['failed'] or summary['skipped']:
+            sys.exit(1)
+
+    except KeyboardInterrupt:
+        print("\n\n⚠ Operation cancelled by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ Unexpected error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+FDM Fleet Exporter
+Runs the export -> poll -> download pipeline for many FDM devices concurrently
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from fdm_archive_codec import CODEC_SUFFIXES, repack_archive
+from fdm_backup_crypto import load_backup_key
+from fdm_config_retriever import FDMConfigRetriever
+from fdm_job_tracker import FDMJobTracker
+from fdm_metrics import METRICS
+from fdm_token_cache import DEFAULT_CACHE_DIR, FDMTokenCache
+
+# Per-device log of backup runs (full exports and "no change" snapshots), one JSON line each
+BACKUP_HISTORY_NAME = 'backup_history.jsonl'
+
+
+def device_dir_name(host):
+    """Directory name for a device's backups (scheme stripped, unsafe characters replaced)"""
+    return re.sub(r'[^\w.-]+', '_', host.split('://')[-1]).strip('_')
+
+
+def load_backup_history(device_dir):
+    """Entries of a device's backup history, oldest first (empty if there is none)"""
+    history_path = Path(device_dir) / BACKUP_HISTORY_NAME
+    if not history_path.exists():
+        return []
+    with open(history_path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_backup_history(device_dir, entry):
+    """Add one entry to a device's backup history"""
+    with open(Path(device_dir) / BACKUP_HISTORY_NAME, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+
+def load_inventory(inventory_path, default_password=None):
+    """Load device inventory from a .json or .csv file
+
+    Each device needs a 'host' and 'username'; 'password', 'filename' and
+    'schedule' (used by the backup daemon) are optional. Devices without a
+    password use default_password.
+    """
+    inventory_path = Path(inventory_path)
+
+    with open(inventory_path, 'r', newline='') as f:
+        if inventory_path.suffix.lower() == '.csv':
+            devices = list(csv.DictReader(f))
+        else:
+            devices = json.load(f)
+            if isinstance(devices, dict):
+                devices = devices.get('devices', [])
+
+    inventory = []
+    for device in devices:
+        host = (device.get('host') or '').strip()
+        username = (device.get('username') or '').strip()
+        if not host or not username:
+            raise ValueError(f"Inventory entry needs 'host' and 'username': {device}")
+
+        inventory.append({
+            'host': host,
+            'username': username,
+            'password': device.get('password') or default_password,
+            'filename': (device.get('filename') or '').strip() or None,
+            'schedule': (device.get('schedule') or '').strip() or None
+        })
+
+    return inventory
+
+
+class FDMFleetExporter:
+    """Exports configurations from a fleet of FDM devices with bounded concurrency
+
+    With full_export_days set, each device's change fingerprint is compared
+    with the one recorded at its last full export. If nothing changed, a
+    "no change" snapshot pointing at that backup is recorded instead of
+    exporting, but never for longer than full_export_days in a row.
+    With encryption_key, backups are encrypted as they are downloaded.
+    """
+
+    def __init__(self, output_dir=".", max_workers=8, per_device_limit=1,
+                 export_timeout=300, delete_remote=False, token_cache=None, archive_format='zip',
+                 prune_remote_days=None, full_export_days=None, encryption_key=None):
+        if encryption_key and archive_format != 'zip':
+            raise ValueError("Encrypted backups can't also be re-packed; use one or the other")
+        self.output_dir = Path(output_dir)
+        self.encryption_key = encryption_key
+        self.full_export_days = full_export_days
+        self.prune_remote_days = prune_remote_days
+        self.archive_format = archive_format
+        self.token_cache = token_cache
+        self.max_workers = max_workers
+        self.per_device_limit = per_device_limit
+        self.export_timeout = export_timeout
+        self.delete_remote = delete_remote
+        self._device_slots = {}
+        self._slots_lock = threading.Lock()
+        # One poll loop watches the export jobs of every device
+        self.job_tracker = FDMJobTracker()
+
+    def _device_slot(self, host):
+        """Get the semaphore limiting concurrent pipelines against one device"""
+        with self._slots_lock:
+            if host not in self._device_slots:
+                self._device_slots[host] = threading.BoundedSemaphore(self.per_device_limit)
+            return self._device_slots[host]
+
+    def create_client(self, host):
+        """Create an export client wired to the shared job tracker and token cache"""
+        return FDMConfigRetriever(host, job_tracker=self.job_tracker, token_cache=self.token_cache)
+
+    def unchanged_backup(self, device_dir, fingerprint):
+        """The last full backup if it is still current for this fingerprint, else None"""
+        if fingerprint is None:
+            return None
+        full_backups = [entry for entry in load_backup_history(device_dir) if not entry.get('unchanged')]
+        if not full_backups:
+            return None
+        last = full_backups[-1]
+        if (last.get('fingerprint') != fingerprint or not Path(last['file']).exists()
+                or time.time() - last['time'] >= self.full_export_days * 86400):
+            return None
+        return last
+
+    def export_device(self, device, client=None):
+        """Run export -> poll -> download for a single device and return its result
+
+        An already authenticated client can be passed in to reuse its session.
+        """
+        host = device['host']
+        result = {'host': host, 'status': 'FAILED', 'stage': None,
+                  'file': None, 'sizeBytes': 0, 'unchanged': False, 'error': None}
+        started = time.time()
+        device_dir = self.output_dir / device_dir_name(host)
+        fingerprint = None
+
+        with self._device_slot(host):
+            try:
+                result['stage'] = 'authenticate'
+                client = client or self.create_client(host)
+                if client.needs_login():
+                    if not device.get('password') and not self.token_cache:
+                        raise ValueError("No password configured")
+                    if not client.authenticate(device['username'], device['password']):
+                        raise RuntimeError("Authentication failed")
+
+                if self.full_export_days is not None:
+                    result['stage'] = 'fingerprint'
+                    fingerprint = client.get_change_fingerprint()
+                    previous = self.unchanged_backup(device_dir, fingerprint)
+                    if previous:
+                        result.update(status='SUCCESS', stage='done', unchanged=True,
+                                      file=previous['file'], sizeBytes=previous['sizeBytes'],
+                                      sha256=previous['sha256'])
+                        append_backup_history(device_dir, {
+                            'time': time.time(), 'fingerprint': fingerprint, 'unchanged': True,
+                            'file': previous['file'], 'sizeBytes': previous['sizeBytes'],
+                            'sha256': previous['sha256']})
+                        print(f"✓ [{host}] unchanged since {previous['file']}, export skipped")
+                        return self._finish(result, started)
+
+                result['stage'] = 'export'
+                job_id = client.export_configuration(disk_filename=device.get('filename'))
+                if not job_id:
+                    raise RuntimeError("Export job creation failed")
+
+                result['stage'] = 'wait'
+                status_data = client.wait_for_export_completion(job_id, timeout=self.export_timeout)
+                if not status_data or not status_data.get('diskFileName'):
+                    raise RuntimeError("Export job did not complete")
+                exported_filename = status_data['diskFileName']
+
+                result['stage'] = 'download'
+                device_dir.mkdir(parents=True, exist_ok=True)
+                downloaded_file = client.download_config_file(exported_filename, device_dir,
+                                                              encryption_key=self.encryption_key)
+                if not downloaded_file:
+                    raise RuntimeError("Download failed")
+
+                if self.delete_remote:
+                    result['stage'] = 'delete'
+                    client.delete_config_file(exported_filename)
+
+                if self.prune_remote_days is not None:
+                    result['stage'] = 'prune'
+                    # Never prune the export that was just taken
+                    pruned = client.prune_config_files(older_than=self.prune_remote_days * 86400,
+                                                       keep_latest=1)
+                    result['prunedRemote'] = len(pruned)
+
+                result.update({
+                    'file': downloaded_file,
+                    'sizeBytes': client.last_download['sizeBytes'],
+                    'sha256': client.last_download['sha256']
+                })
+
+                if self.archive_format != 'zip':
+                    result['stage'] = 'repack'
+                    repacked = repack_archive(downloaded_file, self.archive_format)
+                    result.update(file=repacked['output'], archiveBytes=repacked['repackedBytes'])
+
+                if self.full_export_days is not None:
+                    append_backup_history(device_dir, {
+                        'time': time.time(), 'fingerprint': fingerprint, 'unchanged': False,
+                        'file': result['file'], 'sizeBytes': result['sizeBytes'],
+                        'sha256': result['sha256']})
+
+                result.update(status='SUCCESS', stage='done')
+            except Exception as e:
+                result['error'] = str(e)
+                print(f"✗ [{host}] {result['stage']} failed: {e}")
+
+        return self._finish(result, started)
+
+    def _finish(self, result, started):
+        result['durationSeconds'] = round(time.time() - started, 2)
+        outcome = 'failed'
+        if result['status'] == 'SUCCESS':
+            outcome = 'unchanged' if result.get('unchanged') else 'ok'
+        METRICS.observe('device_backup', time.time() - started, host=result['host'], outcome=outcome)
+        METRICS.log('device_backup', **result)
+        return result
+
+    def run(self, devices):
+        """Export all devices through a bounded worker pool"""
+        results = []
+        print(f"🚀 Exporting {len(devices)} device(s) with {self.max_workers} worker(s)...")
+
+        self.job_tracker.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = [pool.submit(self.export_device, device) for device in devices]
+                for future in as_completed(futures):
+                    result = future.result()
+                    results.append(result)
+                    if result['status'] == 'SUCCESS' and not result['unchanged']:
+                        print(f"✓ [{result['host']}] {result['file']} "
+                              f"({result['sizeBytes']:,} bytes, {result['durationSeconds']}s)")
+        finally:
+            self.job_tracker.stop()
+
+        return sorted(results, key=lambda r: r['host'])
+
+
+def write_summary(results, summary_path):
+    """Write the per-device result summary as JSON"""
+    summary = {
+        'generatedAt': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'total': len(results),
+        'succeeded': sum(1 for r in results if r['status'] == 'SUCCESS'),
+        'failed': sum(1 for r in results if r['status'] != 'SUCCESS'),
+        'unchanged': sum(1 for r in results if r.get('unchanged')),
+        'devices': results
+    }
+
+    summary_path = Path(summary_path)
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    return summary
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments for fleet mode"""
+    parser = argparse.ArgumentParser(description="Export FDM configurations from a fleet of devices")
+    parser.add_argument('inventory', help="Inventory file (.json or .csv) with host/username columns")
+    parser.add_argument('-o', '--output-dir', default='.', help="Directory for downloaded backups")
+    parser.add_argument('-w', '--workers', type=int, default=8,
+                        help="Maximum devices exported concurrently (default: 8)")
+    parser.add_argument('--per-device', type=int, default=1,
+                        help="Maximum concurrent pipelines per device (default: 1)")
+    parser.add_argument('--timeout', type=int, default=300,
+                        help="Export job timeout per device in seconds (default: 300)")
+    parser.add_argument('--password-env', default='FDM_PASSWORD',
+                        help="Environment variable holding the default password")
+    parser.add_argument('--summary', help="Summary file path [<output-dir>/fleet_summary.json]")
+    parser.add_argument('--delete-remote', action='store_true',
+                        help="Delete the export file from each device after download")
+    parser.add_argument('--prune-remote', type=float, metavar='DAYS',
+                        help="Delete export files older than DAYS from each device after backup")
+    parser.add_argument('--archive-format', choices=['zip'] + sorted(CODEC_SUFFIXES), default='zip',
+                        help="Re-pack each backup with zstd or xz after download (default: keep the zip)")
+    parser.add_argument('--encrypt', action='store_true',
+                        help="Encrypt backups while they download (saved as <name>.zip.enc)")
+    parser.add_argument('--key-file', help="Backup key for --encrypt [$FDM_BACKUP_KEY or "
+                        "~/.fdm_config_manager/backup.key]")
+    parser.add_argument('--skip-unchanged', action='store_true',
+                        help="Skip the export when a device's last deployment is the one already backed up")
+    parser.add_argument('--full-every', type=float, default=7, metavar='DAYS',
+                        help="With --skip-unchanged, still take a full export after DAYS (default: 7)")
+    parser.add_argument('--token-cache', nargs='?', const=str(DEFAULT_CACHE_DIR),
+                        help="Reuse encrypted cached tokens between runs [~/.fdm_config_manager/tokens]")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    try:
+        args = parse_args(argv)
+        METRICS.configure_from_env()
+        devices = load_inventory(args.inventory, default_password=os.environ.get(args.password_env))
+        if not devices:
+            print("✗ Inventory contains no devices")
+            sys.exit(1)
+
+        token_cache = FDMTokenCache(args.token_cache) if args.token_cache else None
+        exporter = FDMFleetExporter(output_dir=args.output_dir, max_workers=args.workers,
+                                    per_device_limit=args.per_device,
+                                    export_timeout=args.timeout,
+                                    delete_remote=args.delete_remote,
+                                    token_cache=token_cache,
+                                    archive_format=args.archive_format,
+                                    prune_remote_days=args.prune_remote,
+                                    full_export_days=args.full_every if args.skip_unchanged else None,
+                                    encryption_key=load_backup_key(args.key_file) if args.encrypt else None)
+        results = exporter.run(devices)
+
+        summary_path = args.summary or Path(args.output_dir) / 'fleet_summary.json'
+        summary = write_summary(results, summary_path)
+
+        print(f"\n📊 Fleet export finished: {summary['succeeded']} succeeded "
+              f"({summary['unchanged']} unchanged), {summary['failed']} failed")
+        print(f"✓ Summary written to: {summary_path}")
+
+        if summary['failed']:
+            sys.exit(1)
+
+    except KeyboardInterrupt:
+        print("\n\n⚠ Operation cancelled by user")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ Unexpected error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
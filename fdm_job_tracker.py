@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+FDM Job Tracker
+Polls many outstanding FDM jobs from one loop with adaptive, jittered backoff
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from fdm_metrics import METRICS
+
+SUCCESS_STATES = ('SUCCESS',)
+FAILURE_STATES = ('FAILED', 'ERROR')
+QUEUED_STATES = ('QUEUED', 'PENDING')
+# Seconds callers wait past a job's own timeout before giving up on its Future
+WAIT_GRACE = 60
+
+
+class TrackedJob:
+    """State of one job being watched by FDMJobTracker"""
+
+    def __init__(self, poll, deadline, on_update, on_done, status_key,
+                 success_states, failure_states, interval, label='job'):
+        self.poll = poll
+        self.deadline = deadline
+        self.on_update = on_update
+        self.on_done = on_done
+        self.status_key = status_key
+        self.success_states = success_states
+        self.failure_states = failure_states
+        self.interval = interval
+        self.label = label
+        self.phase = None
+        self.polls = 0
+        self.started = time.monotonic()
+        self.future = Future()
+
+    def is_terminal(self, status):
+        """Check whether a job status is final"""
+        return status in self.success_states or status in self.failure_states
+
+
+class FDMJobTracker:
+    """Watches FDM jobs across sessions and resolves a Future for each on completion
+
+    Each job is polled on its own schedule. The interval starts short so fast
+    jobs are noticed quickly, grows while the job sits queued or its status is
+    unavailable, grows more gently while it is running, and resets whenever
+    the job changes phase. Every interval is jittered so many jobs started
+    together do not poll in lockstep.
+    """
+
+    def __init__(self, initial_interval=0.5, max_interval=15.0, running_max_interval=5.0,
+                 backoff=1.5, jitter=0.2):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.running_max_interval = running_max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self._queue = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def watch(self, poll, timeout=300, on_update=None, on_done=None, status_key='status',
+              success_states=SUCCESS_STATES, failure_states=FAILURE_STATES, label='job'):
+        """Start watching a job
+
+        poll() must return the job's status dict, or None when the status is
+        unavailable. on_update(status_data) is called for every non-final
+        status and on_done(status_data) once at the end. The returned Future
+        resolves to the final status dict, or None if the job timed out.
+        label names the kind of job in metrics.
+        """
+        job = TrackedJob(poll, time.monotonic() + timeout, on_update, on_done, status_key,
+                         success_states, failure_states, self.initial_interval, label)
+        self._schedule(job, time.monotonic())
+        return job.future
+
+    def wait(self, future, timeout=None):
+        """Wait for a watched job, driving the poll loop if no background thread runs
+
+        With a timeout, None is returned if the job hasn't resolved within
+        that many seconds, the same as for a job that timed out.
+        """
+        if self._thread is None:
+            self.run(until=[future])
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            return None
+
+    def start(self):
+        """Run the poll loop in a background thread so many callers can share it"""
+        with self._cond:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self.run, name='fdm-job-tracker',
+                                                daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop the background poll loop"""
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._cond.notify_all()
+        if thread:
+            thread.join()
+        with self._cond:
+            self._stopping = False
+
+    def pending(self):
+        """Number of jobs still being watched"""
+        with self._cond:
+            return len(self._queue)
+
+    def run(self, until=None):
+        """Poll jobs until the given futures are done (or until stopped if none given)"""
+        while True:
+            with self._cond:
+                while True:
+                    if until is not None and all(f.done() for f in until):
+                        return
+                    if self._stopping:
+                        return
+                    if not self._queue:
+                        if until is not None:
+                            return
+                        self._cond.wait()
+                        continue
+                    delay = self._queue[0][0] - time.monotonic()
+                    if delay <= 0:
+                        _, _, job = heapq.heappop(self._queue)
+                        break
+                    self._cond.wait(delay)
+
+            self._poll_job(job)
+
+    def _schedule(self, job, due):
+        with self._cond:
+            heapq.heappush(self._queue, (due, next(self._counter), job))
+            self._cond.notify_all()
+
+    def _finish(self, job, status_data):
+        METRICS.record_job(job.label, job.polls, time.monotonic() - job.started,
+                           status_data.get(job.status_key) if status_data else None)
+        if job.on_done:
+            job.on_done(status_data)
+        job.future.set_result(status_data)
+
+    def _poll_job(self, job):
+        try:
+            self._advance(job)
+        except Exception as e:
+            # A broken poll or callback fails its own job, never the shared loop
+            if not job.future.done():
+                job.future.set_exception(e)
+
+    def _advance(self, job):
+        job.polls += 1
+        status_data = job.poll()
+        status = status_data.get(job.status_key, 'UNKNOWN') if status_data else None
+        if status_data and job.is_terminal(status):
+            self._finish(job, status_data)
+            return
+
+        if status_data and job.on_update:
+            job.on_update(status_data)
+
+        now = time.monotonic()
+        if now >= job.deadline:
+            self._finish(job, None)
+            return
+
+        self._next_interval(job, status)
+        delay = job.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        self._schedule(job, min(now + delay, job.deadline))
+
+    def _next_interval(self, job, status):
+        if status != job.phase:
+            job.phase = status
+            job.interval = self.initial_interval
+        elif status is None or status in QUEUED_STATES:
+            job.interval = min(job.interval * self.backoff * self.backoff, self.max_interval)
+        else:
+            job.interval = min(job.interval * self.backoff, self.running_max_interval)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+FDM Metrics
+Timing spans, transfer and job counters, emitted as JSON logs and Prometheus metrics
+"""
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Environment variables read by configure_from_env()
+JSON_LOG_ENV = 'FDM_METRICS_JSON'          # file path, or '-' for stderr
+TEXTFILE_ENV = 'FDM_METRICS_TEXTFILE'      # Prometheus textfile collector path
+PORT_ENV = 'FDM_METRICS_PORT'              # '9464' or 'addr:9464' to serve /metrics
+
+
+def endpoint_label(endpoint):
+    """Reduce an API endpoint to its first two segments (drops job ids and filenames)"""
+    return '/'.join(endpoint.split('/')[:2])
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+class _NullSpan:
+    """Span handed out while metrics are disabled; does nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Times a block and records it with FDMMetrics on exit"""
+
+    __slots__ = ('metrics', 'name', 'labels', 'fields', 'start')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.fields = {}
+        self.start = None
+
+    def __enter__(self):
+        self.metrics._stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        self.metrics._stack().pop()
+        self.metrics._record_span(self, seconds, exc)
+        return False
+
+    def set(self, **fields):
+        """Attach extra fields (e.g. bytes=..., status=...) to the span's log line"""
+        self.fields.update(fields)
+
+
+class FDMMetrics:
+    """Collects spans and counters; disabled (and near free) until configured
+
+    Every span becomes a summary (count, sum and max seconds) labelled by
+    outcome, and one JSON log line. A 'bytes' field also counts towards
+    fdm_transfer_bytes_total and adds the throughput to the log line.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.textfile = None
+        self._json_stream = None
+        self._server = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._summaries = {}
+        self._counters = {}
+
+    def configure(self, json_log=None, textfile=None, port=None):
+        """Enable metrics with any of: JSON log path ('-' = stderr), textfile path, HTTP port"""
+        if json_log:
+            self._json_stream = sys.stderr if json_log == '-' else open(json_log, 'a', buffering=1)
+        if textfile:
+            self.textfile = textfile
+            atexit.register(self.write_textfile)
+        if port:
+            self.serve(port)
+        self.enabled = self.enabled or bool(json_log or textfile or port)
+
+    def configure_from_env(self):
+        """Enable metrics from the FDM_METRICS_* environment variables, if set"""
+        self.configure(json_log=os.environ.get(JSON_LOG_ENV),
+                       textfile=os.environ.get(TEXTFILE_ENV),
+                       port=os.environ.get(PORT_ENV))
+
+    def _stack(self):
+        stack = getattr(self._local, 'spans', None)
+        if stack is None:
+            stack = self._local.spans = []
+        return stack
+
+    def span(self, name, **labels):
+        """Context manager timing a block as fdm_<name>_seconds"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, labels)
+
+    def annotate(self, **fields):
+        """Attach fields to the innermost span running in this thread"""
+        if self.enabled and self._stack():
+            self._stack()[-1].set(**fields)
+
+    def phase(self, name):
+        """Decorator timing a client method as a span labelled with the client's host
+
+        A method returning None or False counts as a failed phase.
+        """
+        def decorator(method):
+            @functools.wraps(method)
+            def wrapper(client, *args, **kwargs):
+                if not self.enabled:
+                    return method(client, *args, **kwargs)
+                with Span(self, name, {'host': client.host}) as span:
+                    result = method(client, *args, **kwargs)
+                    if result is None or result is False:
+                        span.set(outcome='failed')
+                    return result
+            return wrapper
+        return decorator
+
+    def inc(self, name, value=1, **labels):
+        """Add value to the counter fdm_<name>_total"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """Record one duration in the summary fdm_<name>_seconds"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = [1, seconds, seconds]
+            else:
+                summary[0] += 1
+                summary[1] += seconds
+                summary[2] = max(summary[2], seconds)
+
+    def log(self, event, **fields):
+        """Write one JSON log line (only when a JSON log is configured)"""
+        if self._json_stream is None:
+            return
+        line = json.dumps({'ts': round(time.time(), 3), 'event': event, **fields}, default=str)
+        with self._lock:
+            self._json_stream.write(line + '\n')
+
+    def _record_span(self, span, seconds, exc):
+        fields = span.fields
+        outcome = fields.pop('outcome', None) or ('error' if exc else 'ok')
+        self.observe(span.name, seconds, outcome=outcome, **span.labels)
+
+        if 'bytes' in fields:
+            self.inc('transfer_bytes', fields['bytes'], direction=span.name, **span.labels)
+            fields['bytesPerSecond'] = round(fields['bytes'] / seconds) if seconds > 0 else None
+        if exc is not None:
+            fields['error'] = str(exc)
+        self.log(span.name, seconds=round(seconds, 6), outcome=outcome, **span.labels, **fields)
+
+    def record_job(self, kind, polls, seconds, status):
+        """Record a finished job: polls it took, time to completion and final status"""
+        if not self.enabled:
+            return
+        outcome = (status or 'TIMEOUT').lower()
+        self.inc('job_polls', polls, job=kind)
+        self.observe('job', seconds, job=kind, outcome=outcome)
+        self.log('job', job=kind, polls=polls, seconds=round(seconds, 3), outcome=outcome)
+
+    def render(self):
+        """Current metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            summaries = sorted(self._summaries.items())
+            counters = sorted(self._counters.items())
+
+        last = None
+        for (name, labels), (count, total, peak) in summaries:
+            metric = f'fdm_{name}_seconds'
+            if metric != last:
+                lines.append(f'# TYPE {metric} summary')
+                last = metric
+            lines.append(f'{metric}_count{_format_labels(labels)} {count}')
+            lines.append(f'{metric}_sum{_format_labels(labels)} {total:.6f}')
+        last = None
+        for (name, labels), (count, total, peak) in summaries:
+            metric = f'fdm_{name}_seconds_max'
+            if metric != last:
+                lines.append(f'# TYPE {metric} gauge')
+                last = metric
+            lines.append(f'{metric}{_format_labels(labels)} {peak:.6f}')
+        last = None
+        for (name, labels), value in counters:
+            metric = f'fdm_{name}_total'
+            if metric != last:
+                lines.append(f'# TYPE {metric} counter')
+                last = metric
+            lines.append(f'{metric}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path=None):
+        """Write metrics atomically for node_exporter's textfile collector"""
+        path = path or self.textfile
+        if not path:
+            return
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port):
+        """Serve /metrics over HTTP from a background thread ('port' or 'addr:port')"""
+        address, _, port = str(port).rpartition(':')
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200 if self.path.split('?')[0] in ('/', '/metrics') else 404)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((address or '127.0.0.1', int(port)), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='fdm-metrics', daemon=True).start()
+        return self._server.server_port
+
+
+# Process-wide collector used by all clients
+METRICS = FDMMetrics()
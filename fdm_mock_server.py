@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+FDM Mock Server
+Local stand-in for the FDM REST API endpoints used by this tool, for testing and benchmarks
+"""
+import argparse
+import json
+import random
+import re
+import ssl
+import sys
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from fdm_config_stream import iter_config_archive
+
+API_PREFIX = '/api/fdm/latest/'
+SOFTWARE_VERSION = '7.4.2-172'
+HARDWARE_MODEL = 'Cisco Firepower Threat Defense for VMware'
+DEPLOY_STATES = {'QUEUED': 'QUEUED', 'RUNNING': 'DEPLOYING', 'SUCCESS': 'DEPLOYED', 'FAILED': 'DEPLOY_FAILED'}
+
+
+def iter_synthetic_config(num_objects, seed=0, software_version=SOFTWARE_VERSION,
+                          hardware_model=HARDWARE_MODEL):
+    """Yield a synthetic FDM export: metadata plus num_objects interlinked objects
+
+    Roughly 60% network objects, 10% network groups referencing them, 5%
+    security zones and 25% access rules referencing zones and networks.
+    """
+    rng = random.Random(seed)
+    yield {'type': 'metadata', 'softwareVersion': software_version,
+           'hardwareModel': hardware_model, 'configExportType': 'FULL_EXPORT'}
+
+    zones, networks = [], []
+    for index in range(num_objects):
+        roll = rng.random()
+        obj_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        if roll < 0.05 or not zones:
+            obj = {'type': 'securityzone', 'id': obj_id, 'name': f'zone-{index}', 'mode': 'ROUTED'}
+            zones.append(obj)
+        elif roll < 0.65 or not networks:
+            obj = {'type': 'networkobject', 'id': obj_id, 'name': f'net-{index}',
+                   'subType': 'HOST', 'value': f'10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}'}
+            networks.append(obj)
+        elif roll < 0.75:
+            members = rng.sample(networks, min(len(networks), rng.randint(1, 8)))
+            obj = {'type': 'networkobjectgroup', 'id': obj_id, 'name': f'group-{index}',
+                   'objects': [{'id': m['id'], 'type': m['type'], 'name': m['name']} for m in members]}
+        else:
+            source, destination = rng.choice(zones), rng.choice(networks)
+            obj = {'type': 'accessrule', 'id': obj_id, 'name': f'rule-{index}', 'ruleAction': 'PERMIT',
+                   'sourceZones': [{'id': source['id'], 'type': 'securityzone', 'name': source['name']}],
+                   'destinationNetworks': [{'id': destination['id'], 'type': 'networkobject',
+                                            'name': destination['name']}]}
+        obj['version'] = format(rng.getrandbits(40), 'x')
+        yield obj
+
+
+class MockFDMState:
+    """In-memory device state shared by all request handlers"""
+
+    def __init__(self, objects=1000, job_latency=2.0, job_failure_rate=0.0,
+                 error_rate=0.0, drop_rate=0.0, token_lifetime=1800, seed=0, pending_changes=0,
+                 software_version=SOFTWARE_VERSION, hardware_model=HARDWARE_MODEL):
+        self.objects = objects
+        self.job_latency = job_latency
+        self.job_failure_rate = job_failure_rate
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.token_lifetime = token_lifetime
+        self.seed = seed
+        self.pending_changes = pending_changes
+        self.software_version = software_version
+        self.hardware_model = hardware_model
+        self.tokens = {}
+        self.refresh_tokens = {}
+        self.files = {}
+        self.jobs = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._export_cache = {}
+
+    def chance(self, rate):
+        with self.lock:
+            return rate > 0 and self._rng.random() < rate
+
+    def export_bytes(self, num_objects):
+        """Build (once per size) the zip archive a full export of num_objects produces"""
+        if num_objects not in self._export_cache:
+            archive = b''.join(iter_config_archive(iter_synthetic_config(num_objects, self.seed)))
+            self._export_cache[num_objects] = archive
+        return self._export_cache[num_objects]
+
+    def issue_tokens(self):
+        access, refresh = uuid.uuid4().hex, uuid.uuid4().hex
+        with self.lock:
+            self.tokens[access] = time.time() + self.token_lifetime
+            self.refresh_tokens[refresh] = True
+        return {'access_token': access, 'refresh_token': refresh, 'token_type': 'Bearer',
+                'expires_in': self.token_lifetime, 'refresh_expires_in': self.token_lifetime * 2}
+
+    def create_job(self, kind, **details):
+        job_id = str(uuid.uuid4())
+        with self.lock:
+            self.jobs[job_id] = dict(details, kind=kind, id=job_id, created=time.time(),
+                                     fail=self._rng.random() < self.job_failure_rate, finished=False)
+        return job_id
+
+    def job_status(self, job_id, kind):
+        """Status of a job, advancing it QUEUED -> RUNNING -> SUCCESS/FAILED with time"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if not job or job['kind'] != kind:
+            return None
+
+        elapsed = time.time() - job['created']
+        if elapsed < self.job_latency * 0.2:
+            status = 'QUEUED'
+        elif elapsed < self.job_latency:
+            status = 'RUNNING'
+        else:
+            status = 'FAILED' if job['fail'] or job.get('message') else 'SUCCESS'
+            if status == 'SUCCESS' and not job['finished']:
+                if kind == 'export':
+                    self.files[job['diskFileName']] = (self.export_bytes(self.objects), time.time())
+                elif kind == 'deploy':
+                    self.pending_changes = 0
+            job['finished'] = True
+
+        message = job.get('message') if status == 'FAILED' else None
+        if kind == 'deploy':
+            result = {'id': job_id, 'state': DEPLOY_STATES[status], 'type': 'deploymentstatus',
+                      'statusMessage': message or '', 'startTime': int(job['created'] * 1000)}
+            if status == 'SUCCESS':
+                result['endTime'] = int((job['created'] + self.job_latency) * 1000)
+            return result
+
+        result = {'id': job_id, 'status': status, 'statusMessage': message or f'Job {status.lower()}'}
+        if kind == 'export':
+            result['diskFileName'] = job['diskFileName']
+        else:
+            result['jobHistoryUuid'] = job_id
+            result['autoDeploy'] = job.get('autoDeploy', False)
+        return result
+
+
+class MockFDMHandler(BaseHTTPRequestHandler):
+    """Implements the FDM endpoints listed in the README"""
+
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _authorized(self):
+        token = self.headers.get('Authorization', '')[len('Bearer '):]
+        with self.state.lock:
+            expires = self.state.tokens.get(token)
+        return expires is not None and expires > time.time()
+
+    def _dispatch(self, method):
+        state = self.state
+        with state.lock:
+            state.requests += 1
+        body = self._read_body() if method in ('POST', 'PUT') else b''
+
+        if not self.path.startswith(API_PREFIX):
+            return self._send_json(404, {'error': 'Not found'})
+        endpoint = self.path[len(API_PREFIX):].split('?')[0]
+
+        if endpoint == 'fdm/token' and method == 'POST':
+            grant = json.loads(body or b'{}')
+            if grant.get('grant_type') == 'refresh_token':
+                with state.lock:
+                    valid = state.refresh_tokens.pop(grant.get('refresh_token'), False)
+                if not valid:
+                    return self._send_json(400, {'error': 'invalid_grant'})
+            elif not grant.get('username') or not grant.get('password'):
+                return self._send_json(400, {'error': 'invalid_grant'})
+            return self._send_json(200, state.issue_tokens())
+
+        if not self._authorized():
+            return self._send_json(401, {'error': 'Unauthorized'})
+        if state.chance(state.error_rate):
+            return self._send_json(503, {'error': 'Injected failure'})
+
+        for pattern, handler in self.ROUTES:
+            match = re.fullmatch(pattern, f'{method} {endpoint}')
+            if match:
+                return handler(self, body, *match.groups())
+        return self._send_json(404, {'error': f'Unknown endpoint {method} {endpoint}'})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _config_export(self, body):
+        payload = json.loads(body or b'{}')
+        name = payload.get('diskFileName') or f'export-{time.strftime("%Y%m%d%H%M%S")}-{uuid.uuid4().hex[:6]}'
+        if not name.endswith('.zip'):
+            name += '.zip'
+        job_id = self.state.create_job('export', diskFileName=name)
+        self._send_json(200, {'id': job_id, 'jobName': 'Config Export', 'type': 'configexportstatus'})
+
+    def _export_status(self, body, job_id):
+        status = self.state.job_status(job_id, 'export')
+        if status is None:
+            return self._send_json(404, {'error': 'Job not found'})
+        self._send_json(200, status)
+
+    def _import_status(self, body, job_id):
+        status = self.state.job_status(job_id, 'import')
+        if status is None:
+            return self._send_json(404, {'error': 'Job not found'})
+        self._send_json(200, status)
+
+    def _list_jobs(self, kind):
+        with self.state.lock:
+            job_ids = [job_id for job_id, job in self.state.jobs.items() if job['kind'] == kind]
+        items = [self.state.job_status(job_id, kind) for job_id in reversed(job_ids)]
+        limit = int(parse_qs(urlsplit(self.path).query).get('limit', ['100'])[0])
+        self._send_json(200, {'items': items[:limit], 'paging': {'count': len(items), 'limit': limit}})
+
+    def _import_jobs(self, body):
+        self._list_jobs('import')
+
+    def _deploy_jobs(self, body):
+        self._list_jobs('deploy')
+
+    def _deploy(self, body):
+        job_id = self.state.create_job('deploy')
+        self._send_json(200, self.state.job_status(job_id, 'deploy'))
+
+    def _deploy_status(self, body, job_id):
+        status = self.state.job_status(job_id, 'deploy')
+        if status is None:
+            return self._send_json(404, {'error': 'Deployment not found'})
+        self._send_json(200, status)
+
+    def _pending_changes(self, body):
+        count = self.state.pending_changes
+        limit = int(parse_qs(urlsplit(self.path).query).get('limit', ['100'])[0])
+        items = [{'type': 'entitychangeinfo', 'entityType': 'networkobject', 'changeType': 'EDIT'}
+                 for _ in range(min(count, limit))]
+        self._send_json(200, {'items': items, 'paging': {'count': count, 'limit': limit}})
+
+    def _system_info(self, body):
+        self._send_json(200, {'type': 'systeminformation', 'softwareVersion': self.state.software_version,
+                              'platformModel': self.state.hardware_model})
+
+    def _list_files(self, body):
+        query = parse_qs(urlsplit(self.path).query)
+        offset = int(query.get('offset', ['0'])[0])
+        limit = int(query.get('limit', ['100'])[0])
+        items = [{'diskFileName': name, 'sizeBytes': len(data),
+                  'dateModified': time.strftime('%Y-%m-%d %H:%M:%SZ', time.gmtime(modified)),
+                  'type': 'configimportexportfileinfo', 'id': name}
+                 for name, (data, modified) in sorted(self.state.files.items())]
+        self._send_json(200, {'items': items[offset:offset + limit],
+                              'paging': {'count': len(items), 'offset': offset, 'limit': limit,
+                                         'pages': -(-len(items) // limit) if limit else 0}})
+
+    def _delete_file(self, body, name):
+        if self.state.files.pop(name, None) is None:
+            return self._send_json(404, {'error': 'File not found'})
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _download(self, body, name):
+        entry = self.state.files.get(name)
+        if entry is None:
+            return self._send_json(404, {'error': 'File not found'})
+
+        data, start = entry[0], 0
+        range_header = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if range_header:
+            start = int(range_header.group(1))
+            if start >= len(data):
+                return self._send_json(416, {'error': 'Range not satisfiable'})
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+        else:
+            self.send_response(200)
+
+        payload = data[start:]
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+
+        if self.state.chance(self.state.drop_rate):
+            # Simulate a dropped link part-way through the transfer
+            self.wfile.write(payload[:len(payload) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(payload)
+
+    def _upload(self, body):
+        message = BytesParser().parsebytes(
+            b'Content-Type: ' + self.headers.get('Content-Type', '').encode() + b'\r\n\r\n' + body)
+        parts = message.get_payload() if message.is_multipart() else []
+        for part in parts:
+            if part.get_param('name', header='content-disposition') == 'fileToUpload':
+                name = part.get_filename() or f'upload-{uuid.uuid4().hex[:6]}.zip'
+                data = part.get_payload(decode=True)
+                self.state.files[name] = (data, time.time())
+                return self._send_json(200, {'diskFileName': name, 'sizeBytes': len(data),
+                                             'type': 'fileuploadstatus'})
+        self._send_json(422, {'error': 'Missing fileToUpload part'})
+
+    def _config_import(self, body):
+        payload = json.loads(body or b'{}')
+        if payload.get('diskFileName') not in self.state.files:
+            return self._send_json(422, {'error': 'Unknown diskFileName'})
+        message = None
+        if self.state.pending_changes and not payload.get('allowPendingChange'):
+            message = (f'Cannot import configuration with {self.state.pending_changes} '
+                       'objects to be deployed')
+        job_id = self.state.create_job('import', diskFileName=payload['diskFileName'],
+                                       autoDeploy=payload.get('autoDeploy', False), message=message)
+        self._send_json(200, {'jobHistoryUuid': job_id, 'type': 'configimportstatus'})
+
+    ROUTES = [
+        (r'POST action/configexport', _config_export),
+        (r'GET jobs/configexportstatus/([^/]+)', _export_status),
+        (r'GET jobs/configimportstatus/([^/]+)', _import_status),
+        (r'GET action/configfiles', _list_files),
+        (r'DELETE action/configfiles/([^/]+)', _delete_file),
+        (r'GET action/downloadconfigfile/([^/]+)', _download),
+        (r'POST action/uploadconfigfile', _upload),
+        (r'POST action/configimport', _config_import),
+        (r'GET jobs/configimportstatus', _import_jobs),
+        (r'GET operational/deploy', _deploy_jobs),
+        (r'POST operational/deploy', _deploy),
+        (r'GET operational/deploy/([^/]+)', _deploy_status),
+        (r'GET operational/pendingchanges', _pending_changes),
+        (r'GET operational/systeminfo/default', _system_info),
+    ]
+
+
+def start_mock_server(state=None, host='127.0.0.1', port=0, certfile=None, keyfile=None):
+    """Start the mock server in a background thread; returns (server, base_url)"""
+    handler = type('BoundMockFDMHandler', (MockFDMHandler,), {'state': state or MockFDMState()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    scheme = 'http'
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+
+    threading.Thread(target=server.serve_forever, name='fdm-mock-server', daemon=True).start()
+    return server, f'{scheme}://{host}:{server.server_port}'
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Run a local mock FDM API server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--certfile', help="TLS certificate (serves HTTPS when given)")
+    parser.add_argument('--keyfile', help="TLS private key")
+    parser.add_argument('--objects', type=int, default=1000, help="Objects in synthetic exports")
+    parser.add_argument('--job-latency', type=float, default=2.0, help="Seconds each job takes")
+    parser.add_argument('--job-failure-rate', type=float, default=0.0, help="Fraction of jobs that fail")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of API calls answered 503")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Fraction of downloads cut short")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for synthetic data and failures")
+    parser.add_argument('--pending-changes', type=int, default=0,
+                        help="Undeployed changes the device starts with (imports fail until deployed)")
+    parser.add_argument('--software-version', default=SOFTWARE_VERSION, help="Version the device reports")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    state = MockFDMState(objects=args.objects, job_latency=args.job_latency,
+                         job_failure_rate=args.job_failure_rate, error_rate=args.error_rate,
+                         drop_rate=args.drop_rate, seed=args.seed, pending_changes=args.pending_changes,
+                         software_version=args.software_version)
+    server, url = start_mock_server(state, args.host, args.port, args.certfile, args.keyfile)
+    print(f"🧪 Mock FDM listening on {url} (any username/password is accepted)")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("\n⏹ Stopping mock server")
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
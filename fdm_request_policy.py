@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+FDM Request Policy
+Per-host rate limiting, retry with jittered backoff and circuit breaking
+"""
+import random
+import threading
+import time
+import requests.exceptions
+import urllib3
+
+DEFAULT_RATE = 10.0          # requests per second per device
+DEFAULT_BURST = 20
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 60.0
+
+# Methods that may always be retried; other methods only when the request never got through
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+# FDM rejected these without acting on them, so even a POST is safe to resend
+REJECTED_STATUSES = (429, 503)
+# Transport errors worth retrying; a body cut off mid-transfer is one of them
+RETRYABLE_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request to a device whose circuit is open"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting the request rate to one device"""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Stops sending requests to a device after repeated failures
+
+    After failure_threshold consecutive failures the circuit opens and
+    requests fail fast with CircuitOpenError. Once reset_timeout has passed a
+    single trial request is let through; its outcome closes or re-opens it.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_request(self, host):
+        """Raise CircuitOpenError if requests to the device should not be sent now"""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_running:
+                raise CircuitOpenError(f"Circuit open for {host} after {self.failures} consecutive failures")
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class RetryPolicy:
+    """Decides whether and when a failed request is retried"""
+
+    def __init__(self, max_retries=4, backoff_base=0.5, backoff_max=30.0,
+                 retry_statuses=(429, 500, 502, 503, 504)):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_statuses = retry_statuses
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt (full jitter, honours Retry-After)"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass  # HTTP-date form, fall back to backoff
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def never_sent(error):
+        """Check whether a connection error happened before the request reached the device"""
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+_host_controls = {}
+_host_controls_lock = threading.Lock()
+
+
+def host_controls(host):
+    """Get the (TokenBucket, CircuitBreaker) shared by every client talking to host"""
+    with _host_controls_lock:
+        if host not in _host_controls:
+            _host_controls[host] = (TokenBucket(), CircuitBreaker())
+        return _host_controls[host]
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+FDM Token Cache
+Encrypted on-disk cache of FDM access and refresh tokens, keyed by host and user
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # Optional dependency, only needed when the cache is used
+    Fernet = None
+
+DEFAULT_CACHE_DIR = Path.home() / '.fdm_config_manager' / 'tokens'
+# Environment variable holding a Fernet key; otherwise a key file is kept in the cache dir
+CACHE_KEY_ENV = 'FDM_TOKEN_CACHE_KEY'
+
+
+class FDMTokenCache:
+    """Stores token grants encrypted with Fernet (AES-128-CBC + HMAC-SHA256)
+
+    Entries are named after a hash of host and username, and both the key
+    file and the entries are created readable by the owner only.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, key=None):
+        if Fernet is None:
+            raise RuntimeError("Token cache requires the 'cryptography' package "
+                               "(pip3 install cryptography)")
+
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.fernet = Fernet(key or os.environ.get(CACHE_KEY_ENV) or self._load_or_create_key())
+
+    def _load_or_create_key(self):
+        key_path = self.cache_dir / 'cache.key'
+        try:
+            fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            return key_path.read_bytes()
+
+        key = Fernet.generate_key()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+        return key
+
+    def _entry_path(self, host, username):
+        name = hashlib.sha256(f"{host}\0{username}".encode()).hexdigest()
+        return self.cache_dir / f"{name}.token"
+
+    def load(self, host, username):
+        """Load cached tokens for host/username (None if missing or unreadable)"""
+        try:
+            with open(self._entry_path(host, username), 'rb') as f:
+                return json.loads(self.fernet.decrypt(f.read()))
+        except (OSError, ValueError, InvalidToken):
+            return None
+
+    def save(self, host, username, tokens):
+        """Encrypt and store tokens for host/username"""
+        entry_path = self._entry_path(host, username)
+        tmp_path = entry_path.with_name(f"{entry_path.name}.{os.getpid()}.tmp")
+
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.fernet.encrypt(json.dumps(tokens).encode()))
+        os.replace(tmp_path, entry_path)
+
+    def clear(self, host, username):
+        """Remove cached tokens for host/username"""
+        try:
+            self._entry_path(host, username).unlink()
+        except FileNotFoundError:
+            pass